@@ -25,8 +25,10 @@ import os
 from apps.common.filters import register_jinja_filters
 
 from apps.VPS.seed import seed_vps_plans
-from apps.VPS.vps_catalog import VPS_PLANS
+from apps.VPS.vps_catalog import CATALOG
 from apps.VPS.models import VPSPlan
+from apps.VPS.stripe.worker import start_event_workers
+from apps.VPS.stripe.catalog import warm_price_map
 
 from flask_migrate import Migrate
 
@@ -102,6 +104,7 @@ def create_app():
     socketio.init_app(_app)
 
     import apps.chat.socket_events
+    import apps.VPS.socket_events
 
     # Register blueprints
     _app.register_blueprint(home_blueprint)
@@ -116,6 +119,15 @@ def create_app():
     # Register Jinja filters
     register_jinja_filters(_app)
 
+    # CLI: flask stripe-events ...
+    from apps.VPS.stripe.cli import stripe_events_cli, stripe_sync_cli
+    _app.cli.add_command(stripe_events_cli)
+    _app.cli.add_command(stripe_sync_cli)
+
+    # CLI: flask chat ...
+    from apps.chat.cli import chat_cli
+    _app.cli.add_command(chat_cli)
+
     # Initialize the database
     db.init_app(_app)
 
@@ -127,6 +139,20 @@ app = create_app()
 app.config.setdefault("WTF_CSRF_HEADERS", ['X-CSRFToken', 'X-CSRF-Token'])
 
 
+_background_started = False
+
+
+@app.before_request
+def start_background_workers():
+    # Once per serving process: StripeEventLog drain pool + Stripe price map warm-up
+    global _background_started
+    if _background_started:
+        return
+    _background_started = True
+    start_event_workers(app)
+    warm_price_map(app)
+
+
 @app.before_request
 def set_request_timezone():
     tz_cookie = request.cookies.get("tz")
@@ -221,6 +247,33 @@ migrate = Migrate(app, db)
 with app.app_context():
     db.create_all()
 
+    # create_all never ALTERs existing tables: add new columns/indexes explicitly
+    try:
+        from apps.common.schema_upgrades import apply_schema_upgrades
+        apply_schema_upgrades()
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️  Schema upgrades not applied: {e}")
+
+    try:
+        from apps.chat.summary import backfill_missing
+        filled = backfill_missing()
+        if filled:
+            print(f"✅ Backfilled chat summaries for {filled} chat(s)")
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️  Chat summary backfill skipped: {e}")
+
+    try:
+        from apps.VPS.stripe.event_archive import ensure_partitions, check_dedupe_constraint
+        ensure_partitions()
+        columns, ok = check_dedupe_constraint()
+        if not ok:
+            print(f"⚠️  stripe_event_logs has no unique index on ({', '.join(columns)}); webhook logging will fail")
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️  Stripe event log partitions not ensured: {e}")
+
     if not AdminUser.query.first():
         from werkzeug.security import generate_password_hash
 
@@ -233,8 +286,8 @@ with app.app_context():
         print("✅ Default admin user created (admin / changeme)")
 
     try:
-        catalog_codes = {p["plan_code"] for p in VPS_PLANS}
-        existing_codes = {p.plan_code for p in VPSPlan.query.all()}
+        catalog_codes = set(CATALOG.codes)
+        existing_codes = {code for (code,) in db.session.query(VPSPlan.plan_code)}
 
         missing = catalog_codes - existing_codes
         if missing:
@@ -6,6 +6,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_user, current_user, login_required, logout_user
 from apps.Users.models import User
 from apps.admin.models import AdminUser
+from apps.VPS.stripe.customers import provision_customer_async
 from extensions import db, limiter
 import traceback
 import re
@@ -227,6 +228,12 @@ def register():
         db.session.commit()
         login_user(user)
 
+        # Stripe customer is created in the background so the first checkout doesn't wait on it
+        try:
+            provision_customer_async(user.id)
+        except Exception:
+            current_app.logger.exception("Could not schedule Stripe customer provisioning")
+
         return jsonify(success=True, redirect=url_for('users_blueprint.dashboard')), 200
 
     except ValueError as ve:
@@ -84,12 +84,25 @@ class BillingRecord(db.Model):
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
-    # Raw snapshot
-    data = db.Column(JSONType)
+    # Raw snapshot (deferred: list pages never need it; loaded on first access)
+    data = db.deferred(db.Column(JSONType))
+
+    # Stripe `created` of the event (or fetch time) this row reflects; older updates are skipped
+    source_event_at = db.Column(db.DateTime, nullable=True)
 
     user = db.relationship("User", backref=db.backref("billing_records", lazy=True))
 
 
+# Order history: one user's rows newest first (keyset on created_at, id). livemode is
+# filtered as a residual so the default mode='all' page still reads in index order.
+db.Index(
+    "ix_billing_records_user_created",
+    BillingRecord.user_id,
+    BillingRecord.created_at.desc(),
+    BillingRecord.id.desc(),
+)
+
+
 # ======================
 #   VPS
 # ======================
@@ -250,6 +263,46 @@ class VPSPlan(db.Model):
         return f"<VPSPlan {self.name} {self.cpu_cores}c/{self.ram_mb}MB/{self.disk_gb}GB>"
 
 
+# ======================
+#   StripePrice
+# ======================
+class StripePrice(db.Model):
+    """Last resolved Stripe Price per lookup key (persisted so new workers start warm)."""
+    __tablename__ = "stripe_prices"
+
+    id = db.Column(db.Integer, primary_key=True)
+    lookup_key = db.Column(db.String(120), unique=True, nullable=False)
+    price_id = db.Column(db.String(128), nullable=False)
+    resolved_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<StripePrice {self.lookup_key} -> {self.price_id}>"
+
+
+class StripeSyncCursor(db.Model):
+    """
+    Checkpoint for the Stripe reconciliation job, one row per resource.
+
+    starting_after: last object id written by an unfinished run (resume point)
+    run_since:      `created >=` filter that unfinished run was using
+    watermark:      start time of the last completed run (next incremental `since`)
+    """
+    __tablename__ = "stripe_sync_cursors"
+
+    id = db.Column(db.Integer, primary_key=True)
+    resource = db.Column(db.String(50), unique=True, nullable=False)  # subscriptions|invoices|checkout_sessions
+    starting_after = db.Column(db.String(255), nullable=True)
+    run_since = db.Column(db.DateTime, nullable=True)
+    run_started_at = db.Column(db.DateTime, nullable=True)
+    watermark = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    synced_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<StripeSyncCursor {self.resource} after={self.starting_after} watermark={self.watermark}>"
+
+
 # ======================
 #   VpsOrder
 # ======================
@@ -303,6 +356,9 @@ class VpsSubscription(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Stripe `created` of the event (or fetch time) this row reflects; older updates are skipped
+    source_event_at = db.Column(db.DateTime, nullable=True)
+
     # Relationships backrefs
     user = db.relationship("User", backref=db.backref("vps_subscriptions", lazy=True))
     plan = db.relationship("VPSPlan")
@@ -311,20 +367,67 @@ class VpsSubscription(db.Model):
         return f"<VpsSubscription user_id={self.user_id} plan_id={self.plan_id} status={self.status}>"
 
 
+# ======================
+#   CheckoutSessionState
+# ======================
+class CheckoutSessionState(db.Model):
+    """
+    Local view of a Checkout Session's outcome, written by the webhook worker
+    (and by the Stripe fallback), so the success/status pages answer from one
+    indexed lookup instead of calling Stripe.
+    """
+    __tablename__ = "checkout_session_states"
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(255), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True, index=True)
+
+    subscription_id = db.Column(db.String(120), index=True)
+    invoice_id = db.Column(db.String(120))
+
+    state = db.Column(db.String(16), nullable=False, default="pending")   # pending | paid | failed
+    payment_status = db.Column(db.String(32))                             # Stripe session.payment_status
+    livemode = db.Column(db.Boolean, default=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<CheckoutSessionState {self.session_id} state={self.state}>"
+
+
 # ======================
 #   StripeEventLog
 # ======================
 class StripeEventLog(db.Model):
+    """
+    Stripe webhook log / work queue, range-partitioned by month on created_at
+    (see apps.VPS.stripe.event_archive). Postgres requires the partition key in
+    every unique constraint, hence (id, created_at) and (event_id, created_at).
+    created_at is the Stripe event's own `created` time, so a redelivery of the
+    same event always lands in the same partition and still dedupes.
+    """
     __tablename__ = "stripe_event_logs"
+    __table_args__ = (
+        db.UniqueConstraint("event_id", "created_at", name="uq_stripe_event_logs_event_id_created_at"),
+        # Keeps the worker's "next unprocessed event" scan small as the log grows
+        db.Index("ix_stripe_event_logs_unprocessed", "id", postgresql_where=db.text("processed = false")),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = db.Column(db.Integer, primary_key=True)
-    event_id = db.Column(db.String(120), unique=True, nullable=False)  # Stripe's event ID
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    event_id = db.Column(db.String(120), nullable=False)               # Stripe's event ID
     type = db.Column(db.String(120), nullable=False)                   # e.g. 'checkout.session.completed'
     payload = db.Column(JSONType, nullable=False)                      # raw JSON payload (verified body)
     valid_sig = db.Column(db.Boolean, nullable=False, default=False)   # signature verified
     processed = db.Column(db.Boolean, nullable=False, default=False)   # whether our app handled it
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, primary_key=True, default=datetime.utcnow)  # Stripe event `created`
     processed_at = db.Column(db.DateTime, nullable=True)
 
+    # Worker bookkeeping (failed events are retried with backoff)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default=db.text("0"))
+    last_error = db.Column(db.String(1000), nullable=True)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+
     def __repr__(self) -> str:  # pragma: no cover
         return f"<StripeEventLog event_id={self.event_id} type={self.type} processed={self.processed}>"
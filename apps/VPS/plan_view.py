@@ -0,0 +1,154 @@
+# apps/VPS/plan_view.py
+"""
+Public plan catalog view model, built once per process.
+
+/vps and /vps/plans.json show the same active plans to every visitor, so the
+rows are read once, merged with the catalog pricing/OS metadata, and kept as:
+  - page_plans: dicts for vps/list.html (shared between requests: read-only)
+  - json_body:  the serialized /plans.json response
+  - etag:       content hash of json_body (same across processes for same data)
+
+Invalidated when VPSPlan rows change (any commit touching a plan, including
+seed_vps_plans and admin edits); VPS_PLAN_CACHE_TTL bounds how long another
+worker process can keep serving a catalog changed elsewhere.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from apps.VPS.models import VPSPlan
+from apps.VPS.vps_catalog import CATALOG
+
+TTL_SECONDS = float(os.getenv("VPS_PLAN_CACHE_TTL", "300"))
+
+_DIRTY_KEY = "vps_plans_dirty"
+
+
+@dataclass(frozen=True)
+class PlanView:
+    page_plans: Tuple[dict, ...]
+    json_body: bytes
+    etag: str
+    built_at: float
+
+
+_VIEW: Optional[PlanView] = None
+_GENERATION = 0
+_LOCK = threading.Lock()
+
+
+def _build() -> PlanView:
+    plans = (
+        VPSPlan.query
+        .filter_by(is_active=True)
+        .order_by(VPSPlan.cpu_cores.asc())
+        .all()
+    )
+    page, api = [], []
+    for p in plans:
+        prices = CATALOG.prices(p.plan_code) or {"currency": "EUR"}
+        ram_gb = int(p.ram_mb / 1024) if p.ram_mb else None
+        os_options = list(CATALOG.os_options(p.plan_code))
+        page.append({
+            "plan_code": p.plan_code,
+            "name": p.name,
+            "description": p.description,
+            "vcpu": p.cpu_cores,
+            "ram_gb": ram_gb,
+            "ssd_gb": p.disk_gb,
+            "bandwidth_tb": p.bandwidth_tb,
+            "lookup_monthly": p.stripe_lookup_key_monthly,
+            "lookup_yearly": p.stripe_lookup_key_yearly,
+            "price_month": prices.get("month"),
+            "price_year":  prices.get("year"),
+            "currency":    prices["currency"],
+            "os_options": os_options,
+        })
+        api.append({
+            "plan_code": p.plan_code,
+            "name": p.name,
+            "description": p.description,
+            "specs": {
+                "vCPU": p.cpu_cores,
+                "RAM_GB": ram_gb,
+                "SSD_GB": p.disk_gb,
+                "Bandwidth_TB": p.bandwidth_tb,
+            },
+            "stripe_lookup_keys": {
+                "monthly": p.stripe_lookup_key_monthly,
+                "yearly": p.stripe_lookup_key_yearly,
+            },
+            "provider": {
+                "name": p.provider,
+                "plan_code": p.provider_plan_code,
+                "default_region": p.default_region,
+            },
+            "pricing": {
+                "month":   prices.get("month"),
+                "year":    prices.get("year"),
+                "currency": prices["currency"],
+            },
+            # Linux-only OS choices, "key:Label" strings
+            "os_options": os_options,
+        })
+
+    body = json.dumps({"ok": True, "plans": api}, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return PlanView(
+        page_plans=tuple(page),
+        json_body=body,
+        etag=hashlib.sha256(body).hexdigest()[:32],
+        built_at=time.time(),
+    )
+
+
+def get_plan_view() -> PlanView:
+    """Current view model; rebuilt on first use, after invalidation or TTL expiry."""
+    global _VIEW
+    view = _VIEW
+    if view is not None and time.time() - view.built_at < TTL_SECONDS:
+        return view
+    generation = _GENERATION
+    view = _build()
+    with _LOCK:
+        # An invalidation that raced the build wins: serve it once, don't keep it
+        if generation == _GENERATION:
+            _VIEW = view
+    return view
+
+
+def invalidate() -> None:
+    global _VIEW, _GENERATION
+    with _LOCK:
+        _VIEW = None
+        _GENERATION += 1
+
+
+# ---- Invalidate on any committed VPSPlan change ----
+def _mark_dirty(_mapper, _connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info[_DIRTY_KEY] = True
+
+
+def _after_commit(session):
+    if session.info.pop(_DIRTY_KEY, False):
+        invalidate()
+
+
+def _after_rollback(session):
+    session.info.pop(_DIRTY_KEY, None)
+
+
+event.listen(VPSPlan, "after_insert", _mark_dirty)
+event.listen(VPSPlan, "after_update", _mark_dirty)
+event.listen(VPSPlan, "after_delete", _mark_dirty)
+event.listen(Session, "after_commit", _after_commit)
+event.listen(Session, "after_rollback", _after_rollback)
@@ -1,13 +1,10 @@
 # VPS/routes/billing_portal.py
 
-import os
-import stripe
-from flask import redirect, url_for
+from flask import url_for
 from flask_login import login_required, current_user
-from extensions import db
 from apps.VPS.vps import vps_blueprint
-
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+from apps.VPS.stripe.customers import ensure_customer
+from apps.VPS.stripe.portal_sessions import get_portal_url
 
 
 @vps_blueprint.route("/billing-portal", methods=["GET"])
@@ -15,22 +12,14 @@ stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 def vps_billing_portal():
     """
     Redirect the logged-in user to Stripe's hosted Billing Portal.
-    Ensures the user has a Stripe Customer ID; creates one if missing.
+    Ensures the user has a Stripe Customer ID; creates one if missing
+    (normally already pre-provisioned at registration). Repeat clicks within
+    the session's validity window reuse the same portal URL.
     """
-    # Ensure the user has a Stripe Customer
-    if not current_user.stripe_customer_id:
-        customer = stripe.Customer.create(
-            email=current_user.email,
-            metadata={"user_id": current_user.id}
-        )
-        current_user.stripe_customer_id = customer.id
-        db.session.commit()
+    customer_id = ensure_customer(current_user)
 
     # Where Stripe should send the user back after managing billing
     return_url = url_for("vps_blueprint.vps_list_page", _external=True)
 
-    session = stripe.billing_portal.Session.create(
-        customer=current_user.stripe_customer_id,
-        return_url=return_url
-    )
-    return "", 303, {"Location": session.url}
+    # Per-user URL: never let a browser/proxy cache the redirect itself
+    return "", 303, {"Location": get_portal_url(customer_id, return_url), "Cache-Control": "no-store"}
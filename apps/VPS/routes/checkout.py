@@ -2,15 +2,17 @@
 
 from flask import request, jsonify, url_for
 import stripe
-import os
 from apps.VPS.vps import vps_blueprint
 from apps.VPS.stripe.catalog import get_price_id
 from apps.VPS.models import VPSPlan, VpsSubscription
 from flask_login import current_user, login_required
 from extensions import db, csrf
+from apps.VPS.stripe.client import configure_stripe
+from apps.VPS.stripe.customers import ensure_customer
+from apps.VPS.stripe.checkout_state import upsert_session_state
 
-# Set Stripe API key from env
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# Shared, pooled Stripe client (API key, timeouts, retries, breaker)
+configure_stripe()
 
 
 @vps_blueprint.route("/checkout", methods=["POST"])
@@ -42,14 +44,12 @@ def vps_checkout():
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
-    # Ensure user has a Stripe customer
-    if not current_user.stripe_customer_id:
-        customer = stripe.Customer.create(
-            email=current_user.email,
-            metadata={"user_id": current_user.id}
-        )
-        current_user.stripe_customer_id = customer.id
-        db.session.commit()
+    # Normally pre-provisioned at registration; only older accounts pay for a create here
+    try:
+        customer_id = ensure_customer(current_user)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"ok": False, "error": f"Stripe error: {str(e)}"}), 500
 
     # Build success/cancel URLs
     success_url = url_for("vps_blueprint.vps_success", _external=True)
@@ -60,7 +60,7 @@ def vps_checkout():
             mode="subscription",
             payment_method_types=["card", "sepa_debit", "bancontact", "ideal", "sofort"],
             line_items=[{"price": price_id, "quantity": 1}],
-            customer=current_user.stripe_customer_id,
+            customer=customer_id,
             success_url=success_url + "?session_id={CHECKOUT_SESSION_ID}",
             cancel_url=cancel_url,
 
@@ -78,4 +78,11 @@ def vps_checkout():
     except Exception as e:
         return jsonify({"ok": False, "error": f"Stripe error: {str(e)}"}), 500
 
+    # Local status row: the success/status pages read this instead of Stripe
+    try:
+        upsert_session_state(session.id, "pending", user_id=current_user.id, livemode=session.get("livemode"))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+
     return jsonify({"ok": True, "checkout_url": session.url})
@@ -1,17 +1,105 @@
-from flask import render_template, request
+from datetime import datetime, timedelta
+
+from flask import render_template, request, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy import tuple_
 from apps.VPS.vps import vps_blueprint
 from apps.VPS.models import BillingRecord
 
+PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Columns the history needs; BillingRecord.data (raw Stripe JSON) is never loaded here
+_LIST_COLUMNS = (
+    BillingRecord.id,
+    BillingRecord.type,
+    BillingRecord.stripe_id,
+    BillingRecord.description,
+    BillingRecord.amount_cents,
+    BillingRecord.currency,
+    BillingRecord.status,
+    BillingRecord.livemode,
+    BillingRecord.hosted_invoice_url,
+    BillingRecord.invoice_pdf,
+    BillingRecord.period_start,
+    BillingRecord.period_end,
+    BillingRecord.created_at,
+)
+
+
+def _encode_cursor(row) -> str:
+    """'<created_at in µs since epoch>.<id>' of the last row on a page."""
+    return f"{(row.created_at - _EPOCH) // timedelta(microseconds=1)}.{row.id}"
+
+
+def _decode_cursor(raw):
+    try:
+        us, rid = raw.split(".", 1)
+        return _EPOCH + timedelta(microseconds=int(us)), int(rid)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _orders_page(user_id: int, mode: str, cursor, per: int):
+    """One page (newest first) plus the cursor for the next one (None on the last page)."""
+    q = BillingRecord.query.with_entities(*_LIST_COLUMNS).filter(BillingRecord.user_id == user_id)
+    if mode == 'live':
+        q = q.filter(BillingRecord.livemode.is_(True))
+    elif mode == 'test':
+        q = q.filter(BillingRecord.livemode.is_(False))
+    if cursor:
+        q = q.filter(tuple_(BillingRecord.created_at, BillingRecord.id) < cursor)
+
+    rows = q.order_by(BillingRecord.created_at.desc(), BillingRecord.id.desc()).limit(per + 1).all()
+    next_cursor = _encode_cursor(rows[per - 1]) if len(rows) > per else None
+    return rows[:per], next_cursor
+
+
+def _page_args():
+    mode = request.args.get('mode', 'all')
+    if mode not in ('all', 'live', 'test'):
+        mode = 'all'
+    try:
+        per = min(max(int(request.args.get('per', PER_PAGE)), 1), MAX_PER_PAGE)
+    except ValueError:
+        per = PER_PAGE
+    return mode, _decode_cursor(request.args.get('after')), per
+
 
 @vps_blueprint.route('/orders', methods=['GET'])
 @login_required
 def orders_page():
-    mode = request.args.get('mode', 'all')
-    q = BillingRecord.query.filter_by(user_id=current_user.id)
-    if mode == 'live':
-        q = q.filter_by(livemode=True)
-    elif mode == 'test':
-        q = q.filter_by(livemode=False)
-    records = q.order_by(BillingRecord.created_at.desc()).all()
-    return render_template('order_history.html', records=records, mode=mode)
+    mode, cursor, per = _page_args()
+    records, next_cursor = _orders_page(current_user.id, mode, cursor, per)
+    return render_template('order_history.html', records=records, mode=mode,
+                           next_cursor=next_cursor, is_first_page=cursor is None)
+
+
+@vps_blueprint.route('/orders.json', methods=['GET'])
+@login_required
+def orders_json():
+    """Same page as /orders; pass `next_cursor` back as ?after= for older rows."""
+    mode, cursor, per = _page_args()
+    records, next_cursor = _orders_page(current_user.id, mode, cursor, per)
+    return jsonify({
+        "items": [{
+            "id": r.id,
+            "type": r.type,
+            "stripe_id": r.stripe_id,
+            "description": r.description,
+            "amount_cents": r.amount_cents,
+            "currency": (r.currency or "").upper() or None,
+            "status": r.status,
+            "livemode": bool(r.livemode),
+            "hosted_invoice_url": r.hosted_invoice_url,
+            "invoice_pdf": r.invoice_pdf,
+            "period_start": r.period_start.isoformat() if r.period_start else None,
+            "period_end": r.period_end.isoformat() if r.period_end else None,
+            "created_at": r.created_at.isoformat() if r.created_at else None,
+        } for r in records],
+        "mode": mode,
+        "per": per,
+        "next_cursor": next_cursor,
+    })
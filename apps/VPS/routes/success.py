@@ -5,8 +5,14 @@ from flask import request, render_template, redirect, url_for, jsonify
 from flask_login import current_user
 from apps.VPS.vps import vps_blueprint
 from apps.VPS.models import BillingRecord
+from apps.VPS.stripe.subscription_cache import get_subscription
+from apps.VPS.stripe.client import configure_stripe
+from apps.VPS.stripe.checkout_state import get_session_state, is_decided_or_fresh, upsert_session_state
 
-from extensions import csrf
+from extensions import db, csrf
+
+# Shared, pooled Stripe client (API key, timeouts, retries, breaker)
+configure_stripe()
 
 
 @vps_blueprint.route("/success", methods=["GET"])
@@ -21,21 +27,7 @@ def vps_success():
         # No session to inspect → bounce back to plans
         return redirect(url_for("vps_blueprint.vps_list_page"))
 
-    # Retrieve session with expansions so we can decide immediately when possible
-    try:
-        sess = stripe.checkout.Session.retrieve(
-            session_id,
-            expand=[
-                "payment_intent",
-                "subscription.latest_invoice.payment_intent",
-                "invoice.payment_intent",
-            ],
-        )
-    except Exception:
-        # If Stripe fetch fails momentarily, treat as pending
-        return render_template("vps/success_pending.html", session_id=session_id, invoice_id=None)
-
-    state, invoice_id = _decide_checkout_state(sess)
+    state, invoice_id = _resolve_checkout_state(session_id)
 
     if state == "paid":
         return render_template("vps/success.html", session_id=session_id)
@@ -49,14 +41,31 @@ def vps_success():
 @csrf.exempt
 def checkout_status():
     """
-    Lightweight JSON endpoint for the pending page to poll.
+    Lightweight JSON endpoint for the pending page (fallback when the socket push is unavailable).
     Returns: {"state": "paid" | "pending" | "failed"}
-    Prefers our DB (webhook-processed) and falls back to live Stripe state.
+    Answers from CheckoutSessionState; Stripe only once a pending row goes stale.
     """
     session_id = request.args.get("session_id")
     if not session_id:
         return jsonify({"state": "failed", "reason": "missing_session"}), 400
 
+    state, _ = _resolve_checkout_state(session_id)
+    return jsonify({"state": state})
+
+
+# ---------- helpers ----------
+
+def _resolve_checkout_state(session_id: str):
+    """
+    ('paid' | 'pending' | 'failed', invoice_id|None) for a checkout session.
+    One indexed lookup in CheckoutSessionState; only a missing or stale pending
+    row falls back to Stripe, and that answer is stored for the next poll.
+    """
+    row = get_session_state(session_id, current_user.id) if current_user.is_authenticated else None
+    if is_decided_or_fresh(row):
+        return row.state, row.invoice_id
+
+    # Retrieve session with expansions so we can decide immediately when possible
     try:
         sess = stripe.checkout.Session.retrieve(
             session_id,
@@ -67,13 +76,33 @@ def checkout_status():
             ],
         )
     except Exception:
-        return jsonify({"state": "pending"})
+        # If Stripe fetch fails momentarily, treat as pending
+        return "pending", (row.invoice_id if row else None)
 
-    state, _ = _decide_checkout_state(sess)
-    return jsonify({"state": state})
+    state, invoice_id = _decide_checkout_state(sess)
+
+    sub = sess.get("subscription")
+    try:
+        upsert_session_state(
+            session_id, state,
+            user_id=current_user.id if current_user.is_authenticated else None,
+            subscription_id=sub.get("id") if isinstance(sub, dict) else sub,
+            invoice_id=invoice_id,
+            payment_status=sess.get("payment_status"),
+            livemode=sess.get("livemode"),
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+    return state, invoice_id
 
 
-# ---------- helpers ----------
+def _invoice_paid_in_db(invoice_id: str) -> bool:
+    if not (invoice_id and current_user.is_authenticated):
+        return False
+    br = BillingRecord.query.filter_by(user_id=current_user.id, invoice_id=invoice_id).first()
+    return bool(br and (br.status or "").lower() == "paid")
+
 
 def _decide_checkout_state(session_obj):
     """
@@ -96,18 +125,23 @@ def _decide_checkout_state(session_obj):
             inv = sub.get("latest_invoice")
         elif isinstance(sub, str) and sub:
             try:
-                sub = stripe.Subscription.retrieve(sub, expand=["latest_invoice.payment_intent"])
+                sub = get_subscription(sub)
                 inv = sub.get("latest_invoice")
+                # Cached from a webhook payload → invoice not expanded; only
+                # go back to Stripe if our DB can't already answer for it
+                if isinstance(inv, str) and not _invoice_paid_in_db(inv):
+                    inv = get_subscription(sub["id"], refresh=True).get("latest_invoice")
             except Exception:
                 inv = None
 
-        invoice_id = inv.get("id") if isinstance(inv, dict) else None
+        if isinstance(inv, str):
+            invoice_id = inv
+        else:
+            invoice_id = inv.get("id") if isinstance(inv, dict) else None
 
         # 1) If our DB already has it marked paid (webhook processed), trust that
-        if invoice_id and current_user.is_authenticated:
-            br = BillingRecord.query.filter_by(user_id=current_user.id, invoice_id=invoice_id).first()
-            if br and (br.status or "").lower() == "paid":
-                return "paid", invoice_id
+        if invoice_id and _invoice_paid_in_db(invoice_id):
+            return "paid", invoice_id
 
         # 2) Otherwise, decide from Stripe object live
         if isinstance(inv, dict):
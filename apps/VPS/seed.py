@@ -1,49 +1,62 @@
 # apps/vps/seed.py
+from decimal import Decimal
+
 from extensions import db
 from apps.VPS.models import VPSPlan
-from apps.VPS.vps_catalog import VPS_PLANS
+from apps.VPS.vps_catalog import CATALOG
+from apps.VPS.plan_view import invalidate as invalidate_plan_view
+
+
+def _plan_columns(plan_data):
+    """Catalog entry -> VPSPlan column values."""
+    return {
+        "name": plan_data["name"],
+        "cpu_cores": plan_data["vcpu"],
+        "ram_mb": plan_data["ram_gb"] * 1024,  # Convert GB → MB
+        "disk_gb": plan_data["storage_gb"],
+        "bandwidth_tb": plan_data["bandwidth_tb"],
+        "stripe_lookup_key_monthly": plan_data["stripe_lookup_key_monthly"],
+        "stripe_lookup_key_yearly": plan_data["stripe_lookup_key_yearly"],
+        "price_per_month": plan_data["monthly_price"],
+        "provider": plan_data["provider"],
+        "provider_plan_code": plan_data["provider_plan_code"],
+        "default_region": plan_data["default_region"],
+        "description": plan_data["description"],
+    }
+
+
+def _changed(current, value) -> bool:
+    # Numeric columns load as Decimal; the catalog holds floats
+    if isinstance(current, Decimal) and value is not None:
+        return current != Decimal(str(value))
+    return current != value
 
 
 def seed_vps_plans():
     """
-    Seed the VPSPlan table from vps_catalog.VPS_PLANS.
+    Seed the VPSPlan table from vps_catalog.CATALOG.
     Idempotent: updates existing plans by plan_code, inserts missing ones.
+    One SELECT for all existing plans; unchanged rows emit no UPDATE, and the
+    remaining writes go out in a single flush.
     """
-    for plan_data in VPS_PLANS:
-        existing = VPSPlan.query.filter_by(plan_code=plan_data["plan_code"]).first()
-        if existing:
-            # Update existing fields in case specs/pricing changed
-            existing.name = plan_data["name"]
-            existing.cpu_cores = plan_data["vcpu"]
-            existing.ram_mb = plan_data["ram_gb"] * 1024  # Convert GB → MB
-            existing.disk_gb = plan_data["storage_gb"]
-            existing.bandwidth_tb = plan_data["bandwidth_tb"]
-            existing.stripe_lookup_key_monthly = plan_data["stripe_lookup_key_monthly"]
-            existing.stripe_lookup_key_yearly = plan_data["stripe_lookup_key_yearly"]
-            existing.price_per_month = plan_data["monthly_price"]
-            existing.provider = plan_data["provider"]
-            existing.provider_plan_code = plan_data["provider_plan_code"]
-            existing.default_region = plan_data["default_region"]
-            existing.description = plan_data["description"]
-        else:
-            # Create new row
-            new_plan = VPSPlan(
-                plan_code=plan_data["plan_code"],
-                name=plan_data["name"],
-                cpu_cores=plan_data["vcpu"],
-                ram_mb=plan_data["ram_gb"] * 1024,  # GB → MB
-                disk_gb=plan_data["storage_gb"],
-                bandwidth_tb=plan_data["bandwidth_tb"],
-                stripe_lookup_key_monthly=plan_data["stripe_lookup_key_monthly"],
-                stripe_lookup_key_yearly=plan_data["stripe_lookup_key_yearly"],
-                price_per_month=plan_data["monthly_price"],
-                provider=plan_data["provider"],
-                provider_plan_code=plan_data["provider_plan_code"],
-                default_region=plan_data["default_region"],
-                description=plan_data["description"],
-                is_active=True
-            )
-            db.session.add(new_plan)
+    existing = {
+        p.plan_code: p
+        for p in VPSPlan.query.filter(VPSPlan.plan_code.in_(CATALOG.codes)).all()
+    }
+
+    new_plans = []
+    for plan_data in CATALOG:
+        values = _plan_columns(plan_data)
+        plan = existing.get(plan_data["plan_code"])
+        if plan is None:
+            new_plans.append(VPSPlan(plan_code=plan_data["plan_code"], is_active=True, **values))
+            continue
+        # Update existing fields in case specs/pricing changed
+        for col, value in values.items():
+            if _changed(getattr(plan, col), value):
+                setattr(plan, col, value)
 
+    db.session.add_all(new_plans)
     db.session.commit()
+    invalidate_plan_view()
     print("✅ VPSPlan table seeded/updated from vps_catalog.")
@@ -0,0 +1,36 @@
+# apps/VPS/socket_events.py
+from flask import request
+from flask_login import current_user
+from flask_socketio import join_room, emit
+
+from extensions import socketio
+from apps.VPS.models import CheckoutSessionState
+from apps.VPS.stripe.events import checkout_room
+
+
+@socketio.on("join_checkout")
+def handle_join_checkout(data):
+    """
+    success_pending page subscribes to its checkout session's outcome.
+    The webhook worker emits "checkout_state" to this room; no polling needed.
+    """
+    session_id = ((data or {}).get("session_id") or "").strip()
+    if not session_id.startswith("cs_"):
+        emit("error", {"error": "Missing session_id"}, to=request.sid)
+        return {"ok": False, "error": "missing_session_id"}
+
+    if not current_user.is_authenticated:
+        return {"ok": False, "error": "not_authenticated"}
+
+    # Session ids are unguessable; still refuse once we know it belongs to someone else
+    owner_id = (
+        CheckoutSessionState.query
+        .with_entities(CheckoutSessionState.user_id)
+        .filter_by(session_id=session_id)
+        .scalar()
+    )
+    if owner_id is not None and owner_id != current_user.id:
+        return {"ok": False, "error": "not_authorized"}
+
+    join_room(checkout_room(session_id))
+    return {"ok": True}
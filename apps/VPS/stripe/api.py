@@ -1,9 +1,10 @@
 # apps/VPS/stripe/api.py
 import stripe
-import os
+from typing import Dict, Iterable
+from apps.VPS.stripe.client import configure_stripe
 
-# Set Stripe API key from env
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# Shared, pooled Stripe client (API key, timeouts, retries, breaker)
+configure_stripe()
 
 def get_price_id_by_lookup_key(lookup_key: str) -> str:
     """
@@ -19,3 +20,23 @@ def get_price_id_by_lookup_key(lookup_key: str) -> str:
     if not prices.data:
         raise ValueError(f"No active price found for lookup key '{lookup_key}'")
     return prices.data[0].id
+
+
+# Stripe accepts at most 10 lookup_keys per Price.list call
+LOOKUP_KEYS_PER_CALL = 10
+
+
+def get_price_ids_by_lookup_keys(lookup_keys: Iterable[str]) -> Dict[str, str]:
+    """
+    Resolve many lookup keys in as few Price.list calls as Stripe allows.
+    Returns {lookup_key: price_id}; keys without an active price are omitted.
+    """
+    keys = sorted({k for k in lookup_keys if k})
+    out: Dict[str, str] = {}
+    for i in range(0, len(keys), LOOKUP_KEYS_PER_CALL):
+        chunk = keys[i:i + LOOKUP_KEYS_PER_CALL]
+        prices = stripe.Price.list(lookup_keys=chunk, active=True, limit=100)
+        for price in prices.data:
+            if price.get("lookup_key"):
+                out[price["lookup_key"]] = price["id"]
+    return out
@@ -0,0 +1,147 @@
+# apps/VPS/stripe/bench_upserts.py
+"""
+Benchmark: legacy SELECT-then-INSERT vs INSERT ... ON CONFLICT for webhook writes.
+
+Each synthetic event logs a StripeEventLog row and upserts an invoice
+BillingRecord (~25% of events touch an invoice seen before, like
+invoice.finalized -> invoice.paid). Events are offered at a fixed rate from a
+thread pool so both variants see the same concurrent load.
+
+Run against a scratch database (it writes and then deletes bench rows):
+    DATABASE_URL=postgresql://... python -m apps.VPS.stripe.bench_upserts --events 3000 --rate 300
+"""
+
+import argparse
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from app import app
+from extensions import db
+from apps.Users.models import User
+from apps.VPS.models import BillingRecord, StripeEventLog
+from apps.VPS.routes.webhook import _log_event
+from apps.VPS.stripe.upserts import upsert_one
+
+BENCH_EMAIL = "bench-upserts@example.invalid"
+BENCH_CUSTOMER = "cus_bench_upserts"
+
+
+def _events(n: int, run: str):
+    invoices = []
+    for i in range(n):
+        if invoices and i % 4 == 0:
+            inv_id = invoices[i % len(invoices)]
+        else:
+            inv_id = f"in_bench_{run}_{i}"
+            invoices.append(inv_id)
+        yield {
+            "id": f"evt_bench_{run}_{i}",
+            "type": "invoice.paid",
+            "livemode": False,
+            "data": {"object": {"id": inv_id, "customer": BENCH_CUSTOMER, "status": "paid",
+                                "amount_paid": 865, "currency": "eur"}},
+        }
+
+
+def _legacy(event, user_id):
+    inv = event["data"]["object"]
+    if not StripeEventLog.query.filter_by(event_id=event["id"]).first():
+        db.session.add(StripeEventLog(event_id=event["id"], type=event["type"], payload=event,
+                                      valid_sig=False, processed=False, created_at=datetime.utcnow()))
+        db.session.commit()
+
+    rec = BillingRecord.query.filter_by(stripe_id=inv["id"]).first()
+    if not rec:
+        rec = BillingRecord(user_id=user_id, stripe_customer_id=inv["customer"], type="invoice", stripe_id=inv["id"])
+        db.session.add(rec)
+    rec.status = inv["status"]
+    rec.amount_cents = inv["amount_paid"]
+    rec.currency = inv["currency"]
+    rec.data = inv
+    db.session.commit()
+
+
+def _upsert(event, user_id):
+    inv = event["data"]["object"]
+    _log_event(event, valid_sig=False)
+    upsert_one(BillingRecord, {
+        "user_id": user_id, "stripe_customer_id": inv["customer"], "type": "invoice", "stripe_id": inv["id"],
+        "status": inv["status"], "amount_cents": inv["amount_paid"], "currency": inv["currency"], "data": inv,
+    }, "stripe_id", fill_if_null=("user_id",), insert_only=("stripe_customer_id", "type"))
+    db.session.commit()
+
+
+def _run(name, fn, events, user_id, rate, threads):
+    latencies, errors = [], {"integrity": 0, "other": 0}
+    lock = threading.Lock()
+
+    def one(ev):
+        with app.app_context():
+            t0 = time.perf_counter()
+            try:
+                fn(ev, user_id)
+            except IntegrityError:
+                db.session.rollback()
+                with lock:
+                    errors["integrity"] += 1
+            except Exception:
+                db.session.rollback()
+                with lock:
+                    errors["other"] += 1
+            with lock:
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for i, ev in enumerate(events):
+            # Offer events at `rate`/s (open loop), so slow paths queue up
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, ev)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+    print(f"{name:>8}: {len(latencies) / elapsed:8.1f} ev/s  "
+          f"p50={statistics.median(latencies):6.2f}ms  p99={p99:6.2f}ms  "
+          f"integrity_errors={errors['integrity']} other_errors={errors['other']}")
+
+
+def _cleanup(user_id):
+    BillingRecord.query.filter(BillingRecord.stripe_id.like("in_bench_%")).delete(synchronize_session=False)
+    StripeEventLog.query.filter(StripeEventLog.event_id.like("evt_bench_%")).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--events", type=int, default=3000)
+    ap.add_argument("--rate", type=float, default=300.0, help="offered events per second")
+    ap.add_argument("--threads", type=int, default=8)
+    args = ap.parse_args()
+
+    with app.app_context():
+        user = User.query.filter_by(email=BENCH_EMAIL).first()
+        if not user:
+            user = User(email=BENCH_EMAIL, password="!", stripe_customer_id=BENCH_CUSTOMER)
+            db.session.add(user)
+            db.session.commit()
+        user_id = user.id
+        _cleanup(user_id)
+
+    for name, fn in (("legacy", _legacy), ("upsert", _upsert)):
+        run = uuid.uuid4().hex[:8]
+        _run(name, fn, list(_events(args.events, run)), user_id, args.rate, args.threads)
+        with app.app_context():
+            _cleanup(user_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# apps/VPS/stripe/bench_webhook.py
+"""
+Benchmark: webhook ack throughput and event processing, fully offline.
+
+Stripe is replaced by the fixture stand-in (apps.VPS.stripe.fake_stripe) and
+every payload is signed with a test secret, so the real verification path in
+`vps_webhook` runs. The event mix per simulated customer is a full signup
+(subscription.created, invoice.finalized/paid/payment_succeeded,
+subscription.updated, checkout.session.completed), some renewals (a share of
+them failing), unhandled "noise" types and Stripe redeliveries, interleaved
+across customers like real traffic.
+
+Two phases, each reporting ev/s, p50/p99 latency and DB statements per event:
+  ack    POST /vps/webhook from --threads concurrent clients
+  drain  --workers threads running the StripeEventLog worker (process_next)
+
+Run against a scratch database (bench users/rows are deleted afterwards):
+    DATABASE_URL=postgresql://... python -m apps.VPS.stripe.bench_webhook --customers 200
+"""
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event as sa_event
+
+import app as app_module
+from app import app
+from extensions import db
+from apps.Users.models import User
+from apps.VPS.models import BillingRecord, VpsSubscription, CheckoutSessionState, StripeEventLog
+from apps.VPS.vps_catalog import VPS_PLANS
+from apps.VPS.routes import webhook as webhook_module
+from apps.VPS.stripe.fake_stripe import FakeStripe, sign_payload, TEST_WEBHOOK_SECRET
+from apps.VPS.stripe.worker import process_next
+from apps.VPS.stripe import subscription_cache, customer_cache
+
+BENCH_EMAIL = "bench-webhook-{}@example.invalid"
+BENCH_EMAIL_LIKE = "bench-webhook-%@example.invalid"
+
+
+class StatementCounter:
+    """Counts SQL statements the app's engine executes (all threads)."""
+
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        sa_event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *_args, **_kw):
+        with self._lock:
+            self.count += 1
+
+    def take(self) -> int:
+        with self._lock:
+            n, self.count = self.count, 0
+        return n
+
+
+def _build_events(fake: FakeStripe, user_ids, renewals: float, failures: float,
+                  noise: float, duplicates: float, seed: int):
+    """Returns (events, noise_count)."""
+    rnd = random.Random(seed)
+    per_customer = []
+    for uid in user_ids:
+        plan = rnd.choice(VPS_PLANS)["plan_code"]
+        seq = fake.signup_events(uid, plan, rnd.choice(("month", "year")), email=BENCH_EMAIL.format(uid))
+        if rnd.random() < renewals:
+            sub_id = seq[0]["data"]["object"]["id"]
+            seq += fake.renewal_events(sub_id, fail=rnd.random() < failures)
+        per_customer.append(seq)
+
+    # Round-robin across customers: per-customer order kept, customers interleaved
+    out, noise_count = [], 0
+    while any(per_customer):
+        for seq in per_customer:
+            if seq:
+                out.append(seq.pop(0))
+                if rnd.random() < noise:
+                    out.append(fake.noise_event())
+                    noise_count += 1
+                if rnd.random() < duplicates:
+                    out.append(out[rnd.randrange(len(out))])  # Stripe redelivery
+    return out, noise_count
+
+
+def _percentile(sorted_ms, p):
+    if not sorted_ms:
+        return 0.0
+    return sorted_ms[min(len(sorted_ms) - 1, max(0, int(len(sorted_ms) * p) - 1))]
+
+
+def _report(name, latencies, elapsed, statements, events, extra=""):
+    latencies.sort()
+    rate = len(latencies) / elapsed if elapsed > 0 else 0.0
+    print(f"{name:>6}: {rate:8.1f} ev/s  "
+          f"p50={statistics.median(latencies) if latencies else 0:7.2f}ms  "
+          f"p99={_percentile(latencies, 0.99):7.2f}ms  "
+          f"sql/event={statements / max(events, 1):5.2f}  {extra}")
+
+
+def _ack_phase(bodies, threads, counter):
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(body):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        headers = {"Stripe-Signature": sign_payload(body, TEST_WEBHOOK_SECRET), "Content-Type": "application/json"}
+        t0 = time.perf_counter()
+        resp = client.post("/vps/webhook", data=body, headers=headers)
+        ms = (time.perf_counter() - t0) * 1000
+        with lock:
+            latencies.append(ms)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+    counter.take()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, bodies))
+    elapsed = time.perf_counter() - start
+    _report("ack", latencies, elapsed, counter.take(), len(bodies),
+            "status=" + ",".join(f"{k}:{v}" for k, v in sorted(statuses.items())))
+
+
+def _drain_phase(workers, counter):
+    latencies, failed = [], 0
+    lock = threading.Lock()
+
+    def loop():
+        nonlocal failed
+        with app.app_context():
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    claimed = process_next()
+                except Exception:
+                    db.session.rollback()
+                    with lock:
+                        failed += 1
+                    continue
+                if not claimed:
+                    return
+                with lock:
+                    latencies.append((time.perf_counter() - t0) * 1000)
+
+    counter.take()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in range(workers):
+            pool.submit(loop)
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        left = StripeEventLog.query.filter(
+            StripeEventLog.event_id.like("evt_fx_%"), StripeEventLog.processed.is_(False)
+        ).count()
+    _report("drain", latencies, elapsed, counter.take(), len(latencies),
+            f"unprocessed_left={left} loop_errors={failed}")
+
+
+def _setup_users(n):
+    with app.app_context():
+        _cleanup()
+        users = [User(email=BENCH_EMAIL.format(f"u{i}"), password="!") for i in range(n)]
+        db.session.add_all(users)
+        db.session.commit()
+        return [u.id for u in users]
+
+
+def _cleanup():
+    user_ids = [uid for (uid,) in db.session.query(User.id).filter(User.email.like(BENCH_EMAIL_LIKE))]
+    if user_ids:
+        for model in (BillingRecord, VpsSubscription, CheckoutSessionState):
+            model.query.filter(model.user_id.in_(user_ids)).delete(synchronize_session=False)
+        User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+    StripeEventLog.query.filter(StripeEventLog.event_id.like("evt_fx_%")).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--customers", type=int, default=200)
+    ap.add_argument("--threads", type=int, default=8, help="concurrent webhook clients (ack phase)")
+    ap.add_argument("--workers", type=int, default=2, help="event workers (drain phase)")
+    ap.add_argument("--renewals", type=float, default=0.5, help="share of customers with a renewal cycle")
+    ap.add_argument("--failures", type=float, default=0.2, help="share of renewals whose payment fails")
+    ap.add_argument("--noise", type=float, default=0.3, help="unhandled events per handled event")
+    ap.add_argument("--duplicates", type=float, default=0.05, help="redelivery probability per event")
+    ap.add_argument("--ack-only", action="store_true", help="skip the drain phase")
+    ap.add_argument("--keep", action="store_true", help="leave bench rows in the database")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    # In-process, deterministic: no background pool, known signing secret, cold caches
+    app_module._background_started = True
+    webhook_module.STRIPE_WEBHOOK_SECRET = TEST_WEBHOOK_SECRET
+    subscription_cache.invalidate()
+    customer_cache.invalidate()
+
+    fake = FakeStripe.from_plans(VPS_PLANS)
+    with app.app_context():
+        counter = StatementCounter(db.engine)
+    user_ids = _setup_users(args.customers)
+    events, noise_count = _build_events(fake, user_ids, args.renewals, args.failures, args.noise,
+                                        args.duplicates, args.seed)
+    bodies = [json.dumps(e).encode() for e in events]
+    print(f"{len(bodies)} events for {len(user_ids)} customers ({noise_count} unhandled types)")
+
+    try:
+        with fake.installed():
+            _ack_phase(bodies, args.threads, counter)
+            if not args.ack_only:
+                _drain_phase(args.workers, counter)
+        print("stripe calls: " + (", ".join(f"{k}={v}" for k, v in sorted(fake.calls.items())) or "none"))
+    finally:
+        if not args.keep:
+            with app.app_context():
+                _cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,56 +9,128 @@ Example return shape:
   "nebula_two":  {"month": "price_...", "year": "price_..."},
   ...
 }
+
+Resolution is batched (Price.list(lookup_keys=[...])) and persisted in
+StripePrice, so a fresh worker starts warm from the DB. Once the in-memory
+copy is older than the TTL it is still served while a background task
+refreshes it (stale-while-revalidate); only a completely cold install
+resolves synchronously.
 """
 
 import time
 import logging
-from typing import Dict
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from flask import current_app
 
-from apps.VPS.models import VPSPlan
-from apps.VPS.stripe.api import get_price_id_by_lookup_key
+from extensions import db, socketio
+from apps.VPS.models import VPSPlan, StripePrice
+from apps.VPS.stripe.api import get_price_ids_by_lookup_keys
+from apps.VPS.stripe.upserts import upsert_many
 
 log = logging.getLogger(__name__)
 
-# simple in-process cache (MVP)
+# in-process copy of the map; "expires_at" only marks it stale, it is never dropped
 _PRICE_MAP_CACHE = {"data": None, "expires_at": 0}
+_REFRESH_LOCK = threading.Lock()
+_refreshing = False
 
 def _now() -> float:
     return time.time()
 
-def get_price_map(ttl_seconds: int = 60) -> Dict[str, Dict[str, str]]:
-    """
-    Returns a dict mapping plan_code -> {"month": price_id, "year": price_id}.
-    Caches for `ttl_seconds` to avoid repeated Stripe calls during traffic spikes.
-    """
-    global _PRICE_MAP_CACHE
-
-    if _PRICE_MAP_CACHE["data"] is not None and _now() < _PRICE_MAP_CACHE["expires_at"]:
-        return _PRICE_MAP_CACHE["data"]
-
-    data: Dict[str, Dict[str, str]] = {}
-    plans = VPSPlan.query.filter_by(is_active=True).all()
-
+def _build_map(plans, price_ids: Dict[str, str]) -> Dict[str, Dict[str, Optional[str]]]:
+    data: Dict[str, Dict[str, Optional[str]]] = {}
     for p in plans:
-        try:
-            month_id = get_price_id_by_lookup_key(p.stripe_lookup_key_monthly)
-        except Exception as e:
-            log.error(f"Stripe price not found for monthly lookup '{p.stripe_lookup_key_monthly}' (plan={p.plan_code}): {e}")
-            month_id = None
-
-        try:
-            year_id = get_price_id_by_lookup_key(p.stripe_lookup_key_yearly)
-        except Exception as e:
-            log.error(f"Stripe price not found for yearly lookup '{p.stripe_lookup_key_yearly}' (plan={p.plan_code}): {e}")
-            year_id = None
+        month_id = price_ids.get(p.stripe_lookup_key_monthly)
+        year_id = price_ids.get(p.stripe_lookup_key_yearly)
+        if not month_id:
+            log.error(f"Stripe price not found for monthly lookup '{p.stripe_lookup_key_monthly}' (plan={p.plan_code})")
+        if not year_id:
+            log.error(f"Stripe price not found for yearly lookup '{p.stripe_lookup_key_yearly}' (plan={p.plan_code})")
 
         # Only include plans that resolve at least one interval
         if month_id or year_id:
             data[p.plan_code] = {"month": month_id, "year": year_id}
         else:
             log.warning(f"Skipping plan '{p.plan_code}' — no Stripe prices resolved.")
+    return data
+
+def _store(data, ttl_seconds: int, resolved_at: float) -> None:
+    global _PRICE_MAP_CACHE
+    _PRICE_MAP_CACHE = {"data": data, "expires_at": resolved_at + ttl_seconds}
 
-    _PRICE_MAP_CACHE = {"data": data, "expires_at": _now() + ttl_seconds}
+def refresh_price_map(ttl_seconds: int = 60) -> Dict[str, Dict[str, str]]:
+    """Resolve every active plan's lookup keys from Stripe, persist (dropping keys not resolved), and cache."""
+    plans = VPSPlan.query.filter_by(is_active=True).all()
+    keys = [k for p in plans for k in (p.stripe_lookup_key_monthly, p.stripe_lookup_key_yearly)]
+    price_ids = get_price_ids_by_lookup_keys(keys)
+
+    now = datetime.utcnow()
+    upsert_many(StripePrice, [
+        {"lookup_key": k, "price_id": pid, "resolved_at": now} for k, pid in sorted(price_ids.items())
+    ], "lookup_key")
+    # Keys Stripe no longer resolves (price deleted/deactivated, plan retired) must not keep serving
+    StripePrice.query.filter(StripePrice.lookup_key.notin_(list(price_ids))).delete(synchronize_session=False)
+    db.session.commit()
+
+    data = _build_map(plans, price_ids)
+    _store(data, ttl_seconds, _now())
+    return data
+
+def _load_from_db(ttl_seconds: int) -> Optional[Dict[str, Dict[str, str]]]:
+    rows = StripePrice.query.all()
+    if not rows:
+        return None
+    plans = VPSPlan.query.filter_by(is_active=True).all()
+    data = _build_map(plans, {r.lookup_key: r.price_id for r in rows})
+    oldest = min(r.resolved_at for r in rows)
+    _store(data, ttl_seconds, oldest.replace(tzinfo=timezone.utc).timestamp() if oldest else 0)
+    return data
+
+def _refresh_in_background(app, ttl_seconds: int) -> None:
+    global _refreshing
+    try:
+        with app.app_context():
+            refresh_price_map(ttl_seconds)
+    except Exception as e:
+        log.error(f"Background Stripe price refresh failed (serving stale map): {e}")
+    finally:
+        with _REFRESH_LOCK:
+            _refreshing = False
+
+def schedule_refresh(ttl_seconds: int = 60, app=None) -> bool:
+    """Start one background refresh unless one is already running."""
+    global _refreshing
+    with _REFRESH_LOCK:
+        if _refreshing:
+            return False
+        _refreshing = True
+    try:
+        socketio.start_background_task(_refresh_in_background, app or current_app._get_current_object(), ttl_seconds)
+    except Exception as e:
+        # The task never started, so nothing else will clear the flag
+        with _REFRESH_LOCK:
+            _refreshing = False
+        log.error(f"Could not start Stripe price refresh (serving stale map): {e}")
+        return False
+    return True
+
+def get_price_map(ttl_seconds: int = 60) -> Dict[str, Dict[str, str]]:
+    """
+    Returns a dict mapping plan_code -> {"month": price_id, "year": price_id}.
+    Never waits on Stripe unless nothing has ever been resolved.
+    """
+    data = _PRICE_MAP_CACHE["data"]
+    if data is None:
+        data = _load_from_db(ttl_seconds)
+        if data is None:
+            # Cold install: nothing to serve yet
+            return refresh_price_map(ttl_seconds)
+
+    if _now() >= _PRICE_MAP_CACHE["expires_at"]:
+        schedule_refresh(ttl_seconds)
     return data
 
 def get_price_id(plan_code: str, interval: str) -> str:
@@ -80,7 +152,10 @@ def get_price_id(plan_code: str, interval: str) -> str:
         raise KeyError(f"No Stripe price ID for plan '{plan_code}' interval '{interval}'")
     return price_id
 
+def warm_price_map(app, ttl_seconds: int = 60) -> None:
+    """Kick off a refresh at startup so the first checkout finds a current map."""
+    schedule_refresh(ttl_seconds, app=app)
+
 def bust_cache():
-    """Force cache refresh on next call."""
-    global _PRICE_MAP_CACHE
-    _PRICE_MAP_CACHE = {"data": None, "expires_at": 0}
+    """Force cache refresh on next call (keeps serving the stale copy meanwhile)."""
+    _PRICE_MAP_CACHE["expires_at"] = 0
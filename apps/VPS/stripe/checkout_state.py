@@ -0,0 +1,108 @@
+# apps/VPS/stripe/checkout_state.py
+"""
+Writes/reads for CheckoutSessionState.
+
+States only move forward: pending -> paid|failed, failed -> paid (a retried
+payment). A late or replayed "pending" never overwrites a decided outcome,
+and nothing overwrites "paid".
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import case, literal, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from extensions import db
+from apps.VPS.models import CheckoutSessionState
+
+FINAL_STATES = ("paid", "failed")
+
+# How long a pending row is trusted before the status page re-checks Stripe
+STALE_AFTER = timedelta(seconds=float(os.getenv("CHECKOUT_STATE_STALE_SECONDS", "60")))
+
+
+def _next_state(current, incoming):
+    if isinstance(incoming, str):
+        incoming = literal(incoming)
+    return case(
+        (current == "paid", "paid"),
+        (incoming == "pending", current),
+        else_=incoming,
+    )
+
+
+def upsert_session_state(
+    session_id: str,
+    state: str,
+    *,
+    user_id: Optional[int] = None,
+    subscription_id: Optional[str] = None,
+    invoice_id: Optional[str] = None,
+    payment_status: Optional[str] = None,
+    livemode: Optional[bool] = None,
+) -> None:
+    """Create or advance the row for one checkout session (one statement)."""
+    now = datetime.utcnow()
+    table = CheckoutSessionState.__table__
+    stmt = pg_insert(CheckoutSessionState).values(
+        session_id=session_id,
+        user_id=user_id,
+        subscription_id=subscription_id,
+        invoice_id=invoice_id,
+        state=state,
+        payment_status=payment_status,
+        livemode=bool(livemode),
+        created_at=now,
+        updated_at=now,
+    )
+    ex = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.session_id],
+        set_={
+            "state": _next_state(table.c.state, ex.state),
+            "user_id": db.func.coalesce(table.c.user_id, ex.user_id),
+            "subscription_id": db.func.coalesce(ex.subscription_id, table.c.subscription_id),
+            "invoice_id": db.func.coalesce(ex.invoice_id, table.c.invoice_id),
+            "payment_status": db.func.coalesce(ex.payment_status, table.c.payment_status),
+            "livemode": ex.livemode if livemode is not None else table.c.livemode,
+            "updated_at": ex.updated_at,
+        },
+    )
+    db.session.execute(stmt)
+
+
+def advance_subscription_state(subscription_id: str, state: str, invoice_id: Optional[str] = None) -> Optional[str]:
+    """
+    Apply an invoice outcome to the checkout that created `subscription_id`.
+    Returns the checkout session id (None if the session isn't known yet).
+    """
+    if not subscription_id:
+        return None
+    table = CheckoutSessionState.__table__
+    stmt = (
+        update(table)
+        .where(table.c.subscription_id == subscription_id)
+        .values(
+            state=_next_state(table.c.state, state),
+            invoice_id=db.func.coalesce(invoice_id, table.c.invoice_id),
+            updated_at=datetime.utcnow(),
+        )
+        .returning(table.c.session_id)
+    )
+    return db.session.execute(stmt).scalars().first()
+
+
+def get_session_state(session_id: str, user_id: int) -> Optional[CheckoutSessionState]:
+    return CheckoutSessionState.query.filter_by(session_id=session_id, user_id=user_id).first()
+
+
+def is_decided_or_fresh(row: Optional[CheckoutSessionState], now: Optional[datetime] = None) -> bool:
+    """True when the local row can answer without asking Stripe."""
+    if row is None:
+        return False
+    if row.state in FINAL_STATES:
+        return True
+    now = now or datetime.utcnow()
+    return (now - (row.updated_at or row.created_at)) < STALE_AFTER
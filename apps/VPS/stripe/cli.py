@@ -0,0 +1,202 @@
+# apps/VPS/stripe/cli.py
+"""
+Flask CLI for Stripe event maintenance.
+
+    flask stripe-events replay                     # all unprocessed events
+    flask stripe-events replay --since 2025-01-01 --type invoice.paid --dry-run
+    flask stripe-events replay --event-id evt_123 --event-id evt_456
+    flask stripe-events replay --include-processed --workers 16
+    flask stripe-events partition                  # convert/create monthly partitions
+    flask stripe-events check                      # webhook dedupe index present?
+    flask stripe-events archive --older-than-days 90 --dry-run
+
+    flask stripe-sync run                          # incremental since last watermark
+    flask stripe-sync run --full --resource subscriptions
+    flask stripe-sync status
+
+Events are replayed from StripeEventLog.payload (no Stripe redelivery needed),
+in parallel across objects but strictly in order per subscription/customer.
+`stripe-sync` rebuilds local rows straight from Stripe's list endpoints.
+"""
+
+import time
+import threading
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from apps.VPS.models import StripeEventLog, StripeSyncCursor
+from apps.VPS.stripe.events import ordering_key
+from apps.VPS.stripe.worker import process_event
+from apps.VPS.stripe.reconcile import RESOURCES, BATCH_SIZE, reconcile
+from apps.VPS.stripe import event_archive
+
+stripe_events_cli = AppGroup("stripe-events", help="Inspect and replay logged Stripe events.")
+stripe_sync_cli = AppGroup("stripe-sync", help="Reconcile local billing tables against Stripe.")
+
+
+def _select_rows(event_ids, types, since, until, include_processed, limit):
+    q = StripeEventLog.query.with_entities(StripeEventLog.id, StripeEventLog.type, StripeEventLog.payload)
+    if event_ids:
+        q = q.filter(StripeEventLog.event_id.in_(event_ids))
+    elif not include_processed:
+        q = q.filter(StripeEventLog.processed.is_(False))
+    if types:
+        q = q.filter(StripeEventLog.type.in_(types))
+    if since:
+        q = q.filter(StripeEventLog.created_at >= since)
+    if until:
+        q = q.filter(StripeEventLog.created_at < until)
+    q = q.order_by(StripeEventLog.id.asc())
+    if limit:
+        q = q.limit(limit)
+    return q.yield_per(1000)
+
+
+def _group(rows):
+    """{ordering_key: [row_id, ...]} with each list in Stripe `created` order."""
+    groups = OrderedDict()
+    types = Counter()
+    for row_id, etype, payload in rows:
+        payload = payload or {}
+        types[etype] += 1
+        groups.setdefault(ordering_key(payload), []).append((payload.get("created") or 0, row_id))
+    return OrderedDict((k, [rid for _, rid in sorted(v)]) for k, v in groups.items()), types
+
+
+@stripe_events_cli.command("replay")
+@click.option("--event-id", "event_ids", multiple=True, help="Replay these Stripe event ids (processed or not).")
+@click.option("--type", "types", multiple=True, help="Only events of this type (repeatable).")
+@click.option("--since", type=click.DateTime(), help="Only events created at/after this time (UTC).")
+@click.option("--until", type=click.DateTime(), help="Only events created before this time (UTC).")
+@click.option("--include-processed", is_flag=True, help="Also re-apply events already marked processed.")
+@click.option("--limit", type=int, default=None, help="Cap the number of events selected.")
+@click.option("--workers", type=int, default=8, show_default=True, help="Parallel object groups.")
+@click.option("--dry-run", is_flag=True, help="Show what would be replayed and exit.")
+def replay(event_ids, types, since, until, include_processed, limit, workers, dry_run):
+    """Re-drive logged events through the webhook handlers."""
+    groups, type_counts = _group(_select_rows(event_ids, types, since, until, include_processed, limit))
+    total = sum(len(v) for v in groups.values())
+
+    click.echo(f"Selected {total} event(s) across {len(groups)} object group(s).")
+    for etype, n in type_counts.most_common():
+        click.echo(f"  {n:>7}  {etype}")
+    if dry_run or not total:
+        if dry_run:
+            click.echo("Dry run: nothing replayed.")
+        return
+
+    app = current_app._get_current_object()
+    stats = Counter()
+    lock = threading.Lock()
+
+    def run_group(row_ids):
+        # One app context (and DB session) per group; rows strictly in order
+        with app.app_context():
+            for rid in row_ids:
+                result = process_event(rid)
+                with lock:
+                    stats["ok" if result else ("busy" if result is None else "failed")] += 1
+
+    started = time.monotonic()
+    last_report = started
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(run_group, ids) for ids in groups.values()]
+        for _ in as_completed(futures):
+            now = time.monotonic()
+            if now - last_report >= 2:
+                last_report = now
+                _report(stats, total, now - started)
+    _report(stats, total, time.monotonic() - started)
+
+    if stats["failed"]:
+        click.echo("Failed events stay unprocessed; see StripeEventLog.last_error.", err=True)
+
+
+def _report(stats, total, elapsed):
+    done = stats["ok"] + stats["failed"] + stats["busy"]
+    rate = done / elapsed if elapsed > 0 else 0.0
+    click.echo(
+        f"[{datetime.utcnow():%H:%M:%S}] {done}/{total} "
+        f"ok={stats['ok']} failed={stats['failed']} skipped_locked={stats['busy']} "
+        f"({rate:.1f} ev/s)"
+    )
+
+
+@stripe_events_cli.command("partition")
+@click.option("--months-ahead", type=int, default=event_archive.MONTHS_AHEAD, show_default=True)
+def partition(months_ahead):
+    """Convert stripe_event_logs to monthly partitions if needed and create upcoming months."""
+    if not event_archive.is_partitioned():
+        click.echo("Converting stripe_event_logs to a partitioned table...")
+        click.echo(f"  copied {event_archive.convert_to_partitioned()} row(s)")
+    created = event_archive.ensure_partitions(months_ahead)
+    click.echo(f"Created: {', '.join(created)}" if created else "All partitions present.")
+
+
+@stripe_events_cli.command("check")
+def check():
+    """Verify the unique index the webhook's ON CONFLICT relies on exists (converted or not)."""
+    columns, ok = event_archive.check_dedupe_constraint()
+    layout = "partitioned" if len(columns) > 1 else "legacy (not partitioned)"
+    click.echo(f"stripe_event_logs: {layout}; webhook conflicts on ({', '.join(columns)})")
+    if not ok:
+        raise click.ClickException(f"no unique index on ({', '.join(columns)}): webhook inserts will fail")
+    click.echo("OK: matching unique index present.")
+
+
+@stripe_events_cli.command("archive")
+@click.option("--older-than-days", type=int, default=event_archive.RETENTION_DAYS, show_default=True)
+@click.option("--out", "out_dir", default=event_archive.ARCHIVE_DIR, show_default=True,
+              type=click.Path(file_okay=False), help="Directory for the .ndjson.gz exports.")
+@click.option("--dry-run", is_flag=True, help="List eligible partitions without exporting or dropping.")
+def archive(older_than_days, out_dir, dry_run):
+    """Export processed month partitions past retention to gzip NDJSON, then drop them."""
+    event_archive.ensure_partitions()
+    report = event_archive.archive_partitions(older_than_days, out_dir, dry_run=dry_run)
+    if not report:
+        click.echo("Nothing past retention.")
+    for r in report:
+        if r["pending"]:
+            status = f"kept ({r['pending']} unprocessed)"
+        elif dry_run:
+            status = "would archive"
+        else:
+            status = f"archived -> {r['file']}" if r["file"] else "kept"
+        click.echo(f"  {r['partition']}  rows={r['rows']}  {status}")
+
+
+@stripe_sync_cli.command("run")
+@click.option("--resource", "resources", multiple=True, type=click.Choice(RESOURCES),
+              help="Only this resource (repeatable). Default: all, in dependency order.")
+@click.option("--since", type=click.DateTime(), help="Only objects created at/after this time (UTC); overrides the watermark.")
+@click.option("--full", is_flag=True, help="Ignore the watermark and list everything.")
+@click.option("--restart", is_flag=True, help="Discard an unfinished run's checkpoint instead of resuming it.")
+@click.option("--batch-size", type=int, default=BATCH_SIZE, show_default=True, help="Objects per upsert statement.")
+def sync_run(resources, since, full, restart, batch_size):
+    """Page through Stripe and upsert subscriptions, invoices and checkout sessions."""
+    started = time.monotonic()
+    results = reconcile(
+        resources or RESOURCES, since=since, full=full, resume=not restart, batch_size=max(1, batch_size)
+    )
+    for resource, r in results.items():
+        click.echo(f"  {resource:<18} seen={r['seen']} written={r['written']} skipped_no_owner={r['skipped']} "
+                   f"no_plan={r['no_plan']}")
+    click.echo(f"Done in {time.monotonic() - started:.1f}s.")
+
+
+@stripe_sync_cli.command("status")
+def sync_status():
+    """Show checkpoints and watermarks."""
+    cursors = {c.resource: c for c in StripeSyncCursor.query.all()}
+    for resource in RESOURCES:
+        c = cursors.get(resource)
+        if c is None:
+            click.echo(f"  {resource:<18} never run")
+            continue
+        state = "complete" if c.completed_at else f"unfinished (after {c.starting_after or '-'})"
+        click.echo(f"  {resource:<18} {state}; watermark={c.watermark or '-'} last_run_rows={c.synced_count}")
@@ -0,0 +1,206 @@
+# apps/VPS/stripe/client.py
+"""
+Shared Stripe HTTP client.
+
+Every module calls `configure_stripe()` instead of setting `stripe.api_key`
+itself, so all SDK calls go through one `stripe.default_http_client`:
+  - keep-alive connection pool (one requests.Session)
+  - connect/read timeouts on every call
+  - bounded, jittered retries (SDK backoff) capped by a process-wide retry budget;
+    the SDK sends an Idempotency-Key on every POST, so retried creates are safe
+  - circuit breaker that fails fast while Stripe is degraded
+  - per-endpoint latency histograms (apps.common.metrics, name "stripe_http")
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+import hashlib
+from urllib.parse import urlsplit
+
+import stripe
+import requests
+from requests.adapters import HTTPAdapter
+
+from apps.common import metrics
+
+log = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", "20"))
+MAX_RETRIES = int(os.getenv("STRIPE_MAX_RETRIES", "2"))
+POOL_SIZE = int(os.getenv("STRIPE_POOL_SIZE", "10"))
+
+# Retry budget: each request earns RATIO tokens (capped), each retry spends one
+RETRY_BUDGET_RATIO = float(os.getenv("STRIPE_RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MAX = float(os.getenv("STRIPE_RETRY_BUDGET_MAX", "10"))
+
+BREAKER_FAILURES = int(os.getenv("STRIPE_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("STRIPE_BREAKER_RESET_SECONDS", "30"))
+
+METRIC = "stripe_http"
+
+# sub_1Nx..., cus_Q2..., cs_test_a1... → {id}; leaves e.g. "billing_portal" alone
+_ID_SEGMENT = re.compile(r"^[a-z]+_[A-Za-z0-9_]*[0-9A-Z][A-Za-z0-9_]*$")
+
+
+def endpoint_label(method: str, url: str) -> str:
+    """'GET /v1/subscriptions/{id}' — stable label for metrics."""
+    path = urlsplit(url).path
+    parts = ["{id}" if _ID_SEGMENT.match(p) else p for p in path.split("/")]
+    return f"{method.upper()} {'/'.join(parts)}"
+
+
+class RetryBudget:
+    def __init__(self, ratio: float, maximum: float):
+        self.ratio = ratio
+        self.maximum = maximum
+        self.tokens = maximum
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.tokens = min(self.maximum, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """closed → open after N consecutive failures → half-open (one probe) after reset."""
+
+    def __init__(self, failures: int, reset_seconds: float):
+        self.threshold = failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    log.warning("Stripe circuit breaker opened")
+                self.opened_at = time.monotonic()
+
+
+class InstrumentedRequestsClient(stripe.RequestsClient):
+    """RequestsClient + breaker, retry budget and latency histograms."""
+
+    def __init__(self, breaker: CircuitBreaker, budget: RetryBudget, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = breaker
+        self.budget = budget
+
+    def request_with_retries(self, *args, **kwargs):
+        self.budget.deposit()
+        return super().request_with_retries(*args, **kwargs)
+
+    def request(self, method, url, headers, post_data=None):
+        label = endpoint_label(method, url)
+        if not self.breaker.allow():
+            metrics.incr(METRIC, f"{label} circuit_open")
+            raise stripe.APIConnectionError("Stripe circuit breaker is open; failing fast.", should_retry=False)
+
+        t0 = time.perf_counter()
+        try:
+            response = super().request(method, url, headers, post_data)
+        except stripe.APIConnectionError:
+            self.breaker.failure()
+            metrics.observe(METRIC, label, (time.perf_counter() - t0) * 1000)
+            metrics.incr(METRIC, f"{label} error")
+            raise
+
+        metrics.observe(METRIC, label, (time.perf_counter() - t0) * 1000)
+        status = response[1]
+        if status >= 500 or status == 429:
+            self.breaker.failure()
+            metrics.incr(METRIC, f"{label} {status}")
+        else:
+            self.breaker.success()
+        return response
+
+    def _should_retry(self, response, api_connection_error, num_retries, max_network_retries):
+        if not super()._should_retry(response, api_connection_error, num_retries, max_network_retries):
+            return False
+        if self.breaker.state == "open":
+            return False
+        return self.budget.try_spend()
+
+
+_breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_SECONDS)
+_budget = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX)
+_client = None
+_lock = threading.Lock()
+
+
+def _build_http_client() -> InstrumentedRequestsClient:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    return InstrumentedRequestsClient(
+        breaker=_breaker,
+        budget=_budget,
+        session=session,
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+    )
+
+
+def configure_stripe():
+    """Idempotently install the shared client; returns the configured `stripe` module."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = _build_http_client()
+                stripe.default_http_client = _client
+                stripe.max_network_retries = MAX_RETRIES
+    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+    return stripe
+
+
+def idempotency_key(*parts) -> str:
+    """Deterministic key for creates that must not duplicate (e.g. one customer per user)."""
+    raw = ":".join(str(p) for p in parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:48]
+
+
+def stats() -> dict:
+    """Breaker/budget state and per-endpoint latency for the admin metrics view."""
+    snap = metrics.snapshot(METRIC)
+    snap["breaker"] = {"state": _breaker.state, "consecutive_failures": _breaker.failures}
+    snap["retry_budget_tokens"] = round(_budget.tokens, 2)
+    return snap
@@ -0,0 +1,52 @@
+# apps/VPS/stripe/customer_cache.py
+"""
+Process-wide LRU of Stripe customer id -> local user id.
+
+A customer is bound to a user once and effectively never changes, so positive
+lookups are kept until evicted (no TTL). Misses are not cached here: an
+unknown customer may be bound by the very next event. `bind` is called after a
+binding commits and also drops any older customer still pointing at that user.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+MAX_ENTRIES = int(os.getenv("STRIPE_CUSTOMER_CACHE_MAX", "4096"))
+
+_CACHE: "OrderedDict[str, int]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def get_user_id(customer_id: str) -> Optional[int]:
+    with _LOCK:
+        user_id = _CACHE.get(customer_id)
+        if user_id is not None:
+            _CACHE.move_to_end(customer_id)
+        return user_id
+
+
+def put(customer_id: str, user_id: int) -> None:
+    with _LOCK:
+        _CACHE[customer_id] = user_id
+        _CACHE.move_to_end(customer_id)
+        while len(_CACHE) > MAX_ENTRIES:
+            _CACHE.popitem(last=False)
+
+
+def bind(customer_id: str, user_id: int) -> None:
+    """A customer was (re)bound to `user_id`: replace whatever we knew about either side."""
+    with _LOCK:
+        for cid in [c for c, uid in _CACHE.items() if uid == user_id]:
+            _CACHE.pop(cid, None)
+    put(customer_id, user_id)
+
+
+def invalidate(customer_id: Optional[str] = None) -> None:
+    """Drop one entry, or everything when customer_id is None."""
+    with _LOCK:
+        if customer_id is None:
+            _CACHE.clear()
+        else:
+            _CACHE.pop(customer_id, None)
@@ -0,0 +1,65 @@
+# apps/VPS/stripe/customers.py
+"""
+Stripe Customer provisioning.
+
+New users get their Stripe customer from a background task right after
+registration, so the first checkout / billing-portal click normally finds
+`stripe_customer_id` already set and makes no extra Stripe call. The request
+path still falls back to `ensure_customer` for users without one (older
+accounts, or a background job that failed); both paths share one idempotency
+key per user, so a racing pair of creates yields a single Stripe customer.
+"""
+
+import logging
+from typing import Optional
+
+import stripe
+from flask import current_app
+from sqlalchemy import update
+
+from extensions import db, socketio
+from apps.Users.models import User
+from apps.VPS.stripe.client import configure_stripe, idempotency_key
+
+# Shared, pooled Stripe client (API key, timeouts, retries, breaker)
+configure_stripe()
+
+log = logging.getLogger(__name__)
+
+
+def ensure_customer(user: User) -> str:
+    """
+    Return the user's Stripe customer id, creating (and storing) it if missing.
+    The first stored id wins; a concurrent create never overwrites it.
+    """
+    if user.stripe_customer_id:
+        return user.stripe_customer_id
+
+    customer = stripe.Customer.create(
+        email=user.email,
+        metadata={"user_id": user.id},
+        idempotency_key=idempotency_key("customer-create", user.id),
+    )
+    db.session.execute(
+        update(User)
+        .where(User.id == user.id, User.stripe_customer_id.is_(None))
+        .values(stripe_customer_id=customer.id)
+    )
+    db.session.commit()
+    return user.stripe_customer_id  # expired by the commit: reloads whichever id won
+
+
+def _provision(app, user_id: int) -> None:
+    with app.app_context():
+        try:
+            user = db.session.get(User, user_id)
+            if user:
+                ensure_customer(user)
+        except Exception:
+            db.session.rollback()
+            log.exception(f"Stripe customer pre-provisioning failed for user {user_id} (checkout will retry)")
+
+
+def provision_customer_async(user_id: int, app=None) -> None:
+    """Create the Stripe customer for `user_id` off the request path."""
+    socketio.start_background_task(_provision, app or current_app._get_current_object(), user_id)
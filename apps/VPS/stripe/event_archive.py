@@ -0,0 +1,282 @@
+# apps/VPS/stripe/event_archive.py
+"""
+Monthly partitions for stripe_event_logs, plus the retention job.
+
+Partitions are named stripe_event_logs_pYYYY_MM and cover [month, next month)
+on created_at (the Stripe event's `created`). A DEFAULT partition catches
+anything outside the pre-created range so an insert never fails; creating a
+month later moves its rows out of DEFAULT first.
+
+Retention: once a month partition is older than the cut-off and has no
+unprocessed rows, its rows are exported to <archive_dir>/<partition>.ndjson.gz
+(one JSON object per line, row_to_json of the full row) and the partition is
+detached and dropped. Hot months stay in Postgres; vacuum and index sizes stay
+bounded to the retention window.
+
+    flask stripe-events partition                 # create upcoming months (daily cron)
+    flask stripe-events archive --older-than-days 90
+"""
+
+import os
+import gzip
+import logging
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+from sqlalchemy import text
+
+from extensions import db
+from apps.VPS.models import StripeEventLog
+
+log = logging.getLogger(__name__)
+
+PARENT = StripeEventLog.__tablename__
+DEFAULT_PARTITION = f"{PARENT}_default"
+
+MONTHS_AHEAD = int(os.getenv("STRIPE_EVENT_PARTITION_MONTHS_AHEAD", "2"))
+RETENTION_DAYS = int(os.getenv("STRIPE_EVENT_RETENTION_DAYS", "90"))
+ARCHIVE_DIR = os.getenv("STRIPE_EVENT_ARCHIVE_DIR", os.path.join("archive", "stripe_events"))
+
+# Columns the partitioned table defines (the legacy -> partitioned copy takes the overlap)
+_MODEL_COLUMNS = [c.name for c in StripeEventLog.__table__.columns]
+
+
+def _month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1)
+
+
+def _add_months(dt: datetime, n: int) -> datetime:
+    m = dt.month - 1 + n
+    return datetime(dt.year + m // 12, m % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT}_p{month:%Y_%m}"
+
+
+def _month_of(name: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(name[len(PARENT) + 2:], "%Y_%m")
+    except ValueError:
+        return None
+
+
+def _scalar(sql: str, **params):
+    return db.session.execute(text(sql), params).scalar()
+
+
+def is_partitioned() -> bool:
+    return _scalar(
+        "SELECT c.relkind = 'p' FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relname = :t AND n.nspname = current_schema()", t=PARENT
+    ) is True
+
+
+# Conversion is one-way, so once seen partitioned there's no need to ask again
+_PARTITIONED_SEEN = False
+
+
+def dedupe_columns() -> List[str]:
+    """
+    Columns of the unique constraint a webhook insert conflicts on.
+    Partitioned: (event_id, created_at), since Postgres requires the partition
+    key in every unique constraint. A legacy table not yet converted with
+    `flask stripe-events partition` only has unique (event_id).
+    """
+    global _PARTITIONED_SEEN
+    if not _PARTITIONED_SEEN:
+        _PARTITIONED_SEEN = is_partitioned()
+    return ["event_id", "created_at"] if _PARTITIONED_SEEN else ["event_id"]
+
+
+def has_unique_on(columns: List[str]) -> bool:
+    """True when stripe_event_logs has a full (non-partial) unique index on exactly `columns`."""
+    return _scalar(
+        "SELECT EXISTS (SELECT 1 FROM pg_index i "
+        "JOIN pg_class c ON c.oid = i.indrelid JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relname = :t AND n.nspname = current_schema() AND i.indisunique AND i.indpred IS NULL "
+        "AND (SELECT array_agg(a.attname::text ORDER BY a.attname) FROM unnest(i.indkey) k "
+        "     JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = k) = :cols)",
+        t=PARENT, cols=sorted(columns),
+    ) is True
+
+
+def check_dedupe_constraint() -> Tuple[List[str], bool]:
+    """(conflict columns the webhook will use, whether a matching unique index exists)."""
+    columns = dedupe_columns()
+    return columns, has_unique_on(columns)
+
+
+def list_partitions() -> List[str]:
+    rows = db.session.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :t ORDER BY c.relname"
+    ), {"t": PARENT}).scalars().all()
+    return list(rows)
+
+
+def _create_month(month: datetime) -> None:
+    name, lo, hi = partition_name(month), month, _add_months(month, 1)
+    bounds = {"lo": lo, "hi": hi}
+    stranded = _scalar(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= :lo AND created_at < :hi)", **bounds
+    )
+    if not stranded:
+        db.session.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES FROM ('{lo:%Y-%m-%d}') TO ('{hi:%Y-%m-%d}')"
+        ))
+        return
+
+    # Rows for this month already sit in DEFAULT: move them into a standalone
+    # table, then attach it (attach validates DEFAULT no longer overlaps).
+    db.session.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    db.session.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :lo AND created_at < :hi RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds)
+    db.session.execute(text(
+        f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM ('{lo:%Y-%m-%d}') TO ('{hi:%Y-%m-%d}')"
+    ))
+
+
+def ensure_partitions(
+    months_ahead: int = MONTHS_AHEAD,
+    start: Optional[datetime] = None,
+    commit: bool = True,
+) -> List[str]:
+    """Create DEFAULT and every month from `start` (default: this month) to months_ahead. Idempotent."""
+    if not is_partitioned():
+        log.warning(f"{PARENT} is not partitioned; run `flask stripe-events partition` to convert it")
+        return []
+    existing = set(list_partitions())
+    created = []
+    if DEFAULT_PARTITION not in existing:
+        db.session.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+        created.append(DEFAULT_PARTITION)
+
+    month = _month_start(start or datetime.utcnow())
+    last = _add_months(_month_start(datetime.utcnow()), months_ahead)
+    while month <= last:
+        if partition_name(month) not in existing:
+            _create_month(month)
+            created.append(partition_name(month))
+        month = _add_months(month, 1)
+    if commit:
+        db.session.commit()
+    return created
+
+
+def _copy_columns(table: str) -> List[str]:
+    """Model columns that `table` actually has (older tables predate some of them)."""
+    existing = set(db.session.execute(text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = :t AND table_schema = current_schema()"
+    ), {"t": table}).scalars())
+    return [c for c in _MODEL_COLUMNS if c in existing]
+
+
+# The legacy created_at is the insert time; the dedupe key needs the event's own `created`
+_CREATED_AT_FROM_PAYLOAD = (
+    "COALESCE(to_timestamp((payload->>'created')::bigint) AT TIME ZONE 'utc', "
+    "created_at, now() AT TIME ZONE 'utc')"
+)
+
+
+def convert_to_partitioned() -> int:
+    """
+    One-off: turn a plain stripe_event_logs table into the partitioned layout.
+    Renames the old table (and its indexes/sequence), creates the partitioned
+    parent from the model (primary key (id, created_at), unique
+    (event_id, created_at)), copies rows, then drops the old table.
+
+    Only columns present on the old table are copied; the rest (e.g. retry
+    bookkeeping on a table that never got it) take their defaults. created_at
+    is rewritten to the payload's Stripe `created` (what the webhook keys
+    redeliveries on), falling back to the old insert time, then the copy time.
+    Returns rows copied.
+    """
+    if is_partitioned():
+        return 0
+    legacy = f"{PARENT}_legacy"
+    db.session.execute(text(f"ALTER TABLE {PARENT} RENAME TO {legacy}"))
+    # Free the names the new table wants (renaming a constraint's index renames the constraint too)
+    for idx in db.session.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :t"), {"t": legacy}).scalars():
+        db.session.execute(text(f'ALTER INDEX "{idx}" RENAME TO "{idx}_legacy"'))
+    db.session.execute(text(f"ALTER SEQUENCE IF EXISTS {PARENT}_id_seq RENAME TO {legacy}_id_seq"))
+
+    StripeEventLog.__table__.create(bind=db.session.connection())
+    oldest = _scalar(f"SELECT min({_CREATED_AT_FROM_PAYLOAD}) FROM {legacy}")
+    ensure_partitions(start=oldest, commit=False)  # whole conversion is one transaction
+
+    columns = _copy_columns(legacy)
+    select_list = ", ".join(_CREATED_AT_FROM_PAYLOAD if c == "created_at" else c for c in columns)
+    copied = db.session.execute(text(
+        f"INSERT INTO {PARENT} ({', '.join(columns)}) SELECT {select_list} FROM {legacy}"
+    )).rowcount
+    db.session.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{PARENT}', 'id'), COALESCE((SELECT max(id) FROM {PARENT}), 1))"
+    ))
+    db.session.execute(text(f"DROP TABLE {legacy}"))
+    db.session.commit()
+    return copied
+
+
+def _eligible(older_than_days: int) -> List[Tuple[str, datetime]]:
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    out = []
+    for name in list_partitions():
+        month = _month_of(name)
+        if month is None or _add_months(month, 1) > cutoff:
+            continue  # DEFAULT, or still inside the retention window
+        out.append((name, month))
+    return out
+
+
+def _export(name: str, out_dir: str) -> Tuple[str, int]:
+    """Stream a partition to gzip NDJSON (server-side cursor; never loads it all)."""
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{name}.ndjson.gz")
+    tmp = path + ".tmp"
+    count = 0
+    result = db.session.connection().execution_options(stream_results=True, yield_per=1000).execute(
+        text(f"SELECT row_to_json(t)::text FROM {name} t ORDER BY id")
+    )
+    with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+        for (line,) in result:
+            fh.write(line)
+            fh.write("\n")
+            count += 1
+    os.replace(tmp, path)
+    return path, count
+
+
+def archive_partitions(
+    older_than_days: int = RETENTION_DAYS,
+    out_dir: str = ARCHIVE_DIR,
+    dry_run: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Export then drop month partitions older than the cut-off. A partition that
+    still holds unprocessed events is left alone (they may yet be retried).
+    """
+    report = []
+    for name, month in _eligible(older_than_days):
+        entry = {"partition": name, "month": f"{month:%Y-%m}", "pending": 0, "rows": None, "file": None}
+        report.append(entry)
+        if not dry_run:
+            # Block late writes into this month while it is checked + exported; only this partition is locked
+            db.session.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+        entry["pending"] = _scalar(f"SELECT count(*) FROM {name} WHERE processed = false")
+        if entry["pending"] or dry_run:
+            entry["rows"] = _scalar(f"SELECT count(*) FROM {name}")
+            db.session.rollback()
+            continue
+
+        path, count = _export(name, out_dir)
+        db.session.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        db.session.execute(text(f"DROP TABLE {name}"))
+        db.session.commit()
+        entry.update(rows=count, file=path)
+        log.info(f"Archived {count} Stripe events from {name} to {path}")
+    return report
@@ -0,0 +1,554 @@
+# apps/VPS/stripe/events.py
+"""
+Stripe event handling, decoupled from the HTTP webhook.
+
+The webhook route only verifies + logs events (StripeEventLog); the worker pool
+in apps.VPS.stripe.worker drains the log and calls `handle_event` for each row.
+"""
+
+import logging
+import stripe
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional, Union, Dict, Any, List, Callable
+
+from flask import g
+
+from extensions import db, socketio
+from apps.VPS.models import VpsSubscription, VPSPlan
+from apps.VPS.vps_catalog import CATALOG
+from apps.Users.models import User                # map customer -> user
+from apps.VPS.models import BillingRecord
+from apps.VPS.stripe.upserts import upsert_one
+from apps.VPS.stripe.subscription_cache import get_subscription, get_subscription_snapshot, put_subscription
+from apps.VPS.stripe.client import configure_stripe
+from apps.VPS.stripe.checkout_state import upsert_session_state, advance_subscription_state
+from apps.VPS.stripe import customer_cache
+
+# Shared, pooled Stripe client (API key, timeouts, retries, breaker)
+configure_stripe()
+
+log = logging.getLogger(__name__)
+
+
+class _UnitOfWork:
+    """State shared by every upsert of one event (lives for one transaction)."""
+
+    def __init__(self):
+        # Request-scoped layer over customer_cache (also remembers misses and pending binds)
+        self.user_ids_by_customer: Dict[str, Optional[int]] = {}
+        self.after_commit: List[Callable[[], None]] = []
+        # Stripe `created` of the event being applied (source_event_at on the rows it writes)
+        self.event_at: Optional[datetime] = None
+
+
+def _uow() -> _UnitOfWork:
+    # Outside event_unit_of_work (ad-hoc calls) fall back to a throwaway scope
+    return g.get("stripe_uow") or _UnitOfWork()
+
+
+def _source_event_at(as_of: Optional[float] = None) -> datetime:
+    """Timestamp a write is stamped with: explicit snapshot time, else the event's, else now."""
+    if as_of is not None:
+        return datetime.utcfromtimestamp(as_of)
+    return _uow().event_at or datetime.utcnow()
+
+
+def _subscription_for_event(sub_id: str):
+    """
+    (subscription, as_of) at least as new as the event being applied. A cached
+    snapshot taken before the event can't show the change it announces, so
+    that case refetches from Stripe instead of reusing the cache.
+    """
+    sub, as_of = get_subscription_snapshot(sub_id)
+    event_at = _uow().event_at
+    if event_at and as_of < event_at.replace(tzinfo=timezone.utc).timestamp():
+        sub, as_of = get_subscription_snapshot(sub_id, refresh=True)
+    return sub, as_of
+
+
+def _is_stale(sub_id: str) -> bool:
+    """True when the stored subscription already reflects a newer event than this one."""
+    event_at = _uow().event_at
+    if not event_at:
+        return False
+    stored = db.session.query(VpsSubscription.source_event_at).filter_by(stripe_subscription_id=sub_id).scalar()
+    return bool(stored and stored > event_at)
+
+
+@contextmanager
+def event_unit_of_work(log_row=None):
+    """
+    One transaction per Stripe event.
+
+    The upserts are INSERT ... ON CONFLICT statements that run immediately via
+    db.session.execute, inside the transaction this block shares; what is
+    deferred is the commit. Marking `log_row` processed is an ORM change that
+    is flushed at commit (autoflush is off, so queries inside the block don't
+    flush it early). Any exception rolls back every write for that event.
+    """
+    uow = _UnitOfWork()
+    g.stripe_uow = uow
+    try:
+        with db.session.no_autoflush:
+            yield uow
+            if log_row is not None:
+                log_row.processed = True
+                log_row.processed_at = datetime.utcnow()
+                log_row.last_error = None
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        g.pop("stripe_uow", None)
+
+    # Side effects (socket pushes) only once the data they announce is committed
+    for fn in uow.after_commit:
+        try:
+            fn()
+        except Exception:
+            log.exception("Stripe event after-commit hook failed")
+
+
+def _find_or_bind_user(
+    customer_id: Optional[str],
+    client_reference_id: Optional[Union[str, int]] = None,
+    subscription_obj: Optional[Dict[str, Any]] = None,
+) -> Optional[int]:
+    """
+    Resolve the local user id for a Stripe customer. If it's the user's first purchase,
+    bind stripe_customer_id to the user using either client_reference_id or subscription metadata.
+    """
+    user_id = _find_user_by_customer(customer_id)
+
+    # Fallback: subscription metadata.user_id or client_reference_id
+    fallback_user_id = None
+    if not user_id:
+        md = (subscription_obj or {}).get("metadata") or {}
+        if md.get("user_id"):
+            try:
+                fallback_user_id = int(md["user_id"])
+            except Exception:
+                pass
+        if fallback_user_id is None and client_reference_id is not None:
+            try:
+                fallback_user_id = int(client_reference_id)
+            except Exception:
+                pass
+        if fallback_user_id:
+            user = db.session.get(User, fallback_user_id)
+            if not user:
+                return None
+            user_id = user.id
+            if customer_id:
+                user.stripe_customer_id = customer_id
+                db.session.add(user)
+                # Pending until the event's single commit; remember it for later lookups,
+                # and only publish it process-wide once it is committed
+                uow = _uow()
+                uow.user_ids_by_customer[customer_id] = user_id
+                uow.after_commit.append(lambda: customer_cache.bind(customer_id, user_id))
+    return user_id
+
+
+
+def _find_user_by_customer(customer_id: str) -> Optional[int]:
+    """Local user id for a customer: per-event map, then process LRU, then one indexed query."""
+    if not customer_id:
+        return None
+    seen = _uow().user_ids_by_customer
+    if customer_id not in seen:
+        user_id = customer_cache.get_user_id(customer_id)
+        if user_id is None:
+            user_id = db.session.query(User.id).filter_by(stripe_customer_id=customer_id).scalar()
+            if user_id is not None:
+                customer_cache.put(customer_id, user_id)
+        seen[customer_id] = user_id
+    return seen[customer_id]
+
+
+
+# Row builders + ON CONFLICT policies, shared with the bulk reconciler
+# (apps.VPS.stripe.reconcile) so both paths write identical rows.
+
+INVOICE_UPSERT = dict(
+    fill_if_null=("user_id",),
+    keep_if_null=("period_start", "period_end"),
+    insert_only=("stripe_customer_id", "type"),
+    newer_than="source_event_at",
+)
+CHECKOUT_SESSION_UPSERT = dict(
+    fill_if_null=("user_id",),
+    insert_only=("stripe_customer_id", "type"),
+    newer_than="source_event_at",
+)
+SUBSCRIPTION_RECORD_UPSERT = dict(
+    fill_if_null=("user_id",),
+    keep_if_null=("amount_cents", "currency", "description"),
+    insert_only=("stripe_customer_id", "type"),
+    newer_than="source_event_at",
+)
+# Keyed on stripe_subscription_id; user_id/plan_id are only filled while NULL
+VPS_SUBSCRIPTION_UPSERT = dict(
+    fill_if_null=("user_id", "plan_id"),
+    keep_if_null=("billing_cycle_anchor", "current_period_start", "current_period_end"),
+    insert_only=("price_lookup_key", "tax_inclusive", "created_at"),
+    newer_than="source_event_at",
+)
+
+
+def invoice_values(inv: dict, livemode: bool, user_id: int, source_event_at: datetime) -> Dict[str, Any]:
+    # description/period from first line if present
+    description, period_start, period_end = None, None, None
+    try:
+        line0 = (inv.get('lines') or {}).get('data', [])[0]
+        description = line0.get('description') or inv.get('description')
+        period = line0.get('period') or {}
+        if period.get('start'): period_start = datetime.utcfromtimestamp(period['start'])
+        if period.get('end'):   period_end   = datetime.utcfromtimestamp(period['end'])
+    except Exception:
+        description = inv.get('description')
+
+    # created_at from invoice if available (keeps order list stable)
+    created_at = None
+    try:
+        if inv.get('created'):
+            created_at = datetime.utcfromtimestamp(inv['created'])
+    except Exception:
+        pass
+
+    return {
+        "user_id": user_id,
+        "stripe_customer_id": inv['customer'],
+        "type": 'invoice',
+        "stripe_id": inv['id'],
+        "invoice_id": inv.get('id'),
+        "subscription_id": inv.get('subscription'),
+        "payment_intent_id": inv.get('payment_intent'),
+        "amount_cents": inv.get('amount_paid') or inv.get('amount_due') or inv.get('amount_remaining'),
+        "currency": (inv.get('currency') or '').lower() or None,
+        "status": inv.get('status'),
+        "livemode": livemode,
+        "hosted_invoice_url": inv.get('hosted_invoice_url'),
+        "invoice_pdf": inv.get('invoice_pdf'),
+        "description": description,
+        "period_start": period_start,
+        "period_end": period_end,
+        "created_at": created_at or datetime.utcnow(),
+        "data": inv,
+        "source_event_at": source_event_at,
+    }
+
+
+def checkout_session_values(sess: dict, livemode: bool, user_id: int, source_event_at: datetime) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "stripe_customer_id": sess.get('customer'),
+        "type": 'checkout_session',
+        "stripe_id": sess['id'],
+        "subscription_id": sess.get('subscription'),
+        "payment_intent_id": sess.get('payment_intent'),
+        "amount_cents": sess.get('amount_total'),  # can be None for subscriptions
+        "currency": (sess.get('currency') or '').lower() or None,
+        "status": sess.get('status'),
+        "livemode": livemode,
+        "description": 'Checkout session',
+        "data": sess,
+        "source_event_at": source_event_at,
+    }
+
+
+def subscription_record_values(sub: dict, livemode: bool, user_id: int, source_event_at: datetime) -> Dict[str, Any]:
+    values = {
+        "user_id": user_id,
+        "stripe_customer_id": sub.get('customer'),
+        "type": 'subscription',
+        "stripe_id": sub['id'],
+        "subscription_id": sub.get('id'),
+        "status": sub.get('status'),
+        "livemode": livemode,
+        "amount_cents": None,
+        "currency": None,
+        "description": None,
+        "data": sub,
+        "source_event_at": source_event_at,
+    }
+    # best-effort amount/currency from first item (invoice shows actual charges)
+    try:
+        price = sub['items']['data'][0]['price']
+        values["amount_cents"] = price.get('unit_amount')
+        values["currency"] = price.get('currency')
+        values["description"] = price.get('nickname') or price.get('id')
+    except Exception:
+        pass
+    return values
+
+
+def subscription_plan_code(stripe_sub) -> Optional[str]:
+    """
+    plan_code set in metadata at checkout; for subscriptions created elsewhere
+    (dashboard, API), the plan whose Stripe lookup key the price carries.
+    """
+    plan_code = (stripe_sub.get("metadata") or {}).get("plan_code")
+    if plan_code:
+        return plan_code
+    items = (stripe_sub.get("items") or {}).get("data") or []
+    lookup_key = (items[0].get("price") or {}).get("lookup_key") if items else None
+    plan, _interval = CATALOG.by_lookup_key(lookup_key) if lookup_key else (None, None)
+    return plan["plan_code"] if plan else None
+
+
+def vps_subscription_values(stripe_sub, plan_id: Optional[int], source_event_at: datetime) -> Dict[str, Any]:
+    """
+    VpsSubscription row for a stripe.Subscription object.
+    We expect metadata {'user_id','plan_code','interval'} set during checkout.
+    """
+    price_obj = stripe_sub["items"]["data"][0]["price"]    # single-item MVP
+    user_id = (stripe_sub.get("metadata") or {}).get("user_id")
+
+    def _ts(key):
+        return datetime.utcfromtimestamp(stripe_sub[key]) if stripe_sub.get(key) else None
+
+    now = datetime.utcnow()
+    return {
+        "stripe_subscription_id": stripe_sub["id"],
+        "user_id": int(user_id) if user_id else None,
+        "plan_id": plan_id,
+        "stripe_customer_id": stripe_sub["customer"],
+        "stripe_price_id": price_obj["id"],
+        "price_lookup_key": None,  # optional; we store for debugging during checkout
+        "interval": price_obj["recurring"]["interval"],           # month|year
+        "currency": price_obj["currency"].lower(),
+        "unit_amount": (price_obj.get("unit_amount") or 0) / 100.0,
+        "tax_inclusive": True,
+        "status": stripe_sub["status"],                          # trialing, active, past_due, canceled, unpaid, incomplete...
+        "cancel_at_period_end": stripe_sub.get("cancel_at_period_end", False),
+        "billing_cycle_anchor": _ts("billing_cycle_anchor"),
+        "current_period_start": _ts("current_period_start"),
+        "current_period_end": _ts("current_period_end"),
+        "created_at": now,
+        "updated_at": now,
+        "source_event_at": source_event_at,
+    }
+
+
+def _upsert_invoice_record(inv: dict, livemode: bool):
+    # Try to resolve via invoice.customer. If unknown, try retrieving the subscription once
+    sub_obj = None
+    if not _find_user_by_customer(inv.get('customer')):
+        # Safe, single retrieval to get metadata.user_id
+        try:
+            if inv.get('subscription'):
+                sub_obj = get_subscription(inv['subscription'])
+        except Exception:
+            sub_obj = None
+
+    user_id = _find_or_bind_user(
+        inv.get('customer'),
+        client_reference_id=None,
+        subscription_obj=sub_obj
+    )
+    if not user_id:
+        return None
+
+    opts = dict(INVOICE_UPSERT)
+    if not inv.get('created'):
+        # No Stripe timestamp to trust; keep whatever created_at we first stored
+        opts["insert_only"] += ("created_at",)
+    return upsert_one(BillingRecord, invoice_values(inv, livemode, user_id, _source_event_at()), "stripe_id", **opts)
+
+
+def _upsert_checkout_session(sess: dict, livemode: bool):
+    user_id = _find_or_bind_user(
+        sess.get('customer'),
+        client_reference_id=sess.get('client_reference_id'),
+        subscription_obj=None
+    )
+    if not user_id:
+        return None
+
+    return upsert_one(BillingRecord, checkout_session_values(sess, livemode, user_id, _source_event_at()),
+                      "stripe_id", **CHECKOUT_SESSION_UPSERT)
+
+
+def _upsert_subscription_record(sub: dict, livemode: bool, as_of: Optional[float] = None):
+    """Keep a lightweight subscription record (informational in history)."""
+    user_id = _find_user_by_customer(sub.get('customer'))
+    if not user_id:
+        return None
+
+    return upsert_one(BillingRecord, subscription_record_values(sub, livemode, user_id, _source_event_at(as_of)),
+                      "stripe_id", **SUBSCRIPTION_RECORD_UPSERT)
+
+
+def _upsert_subscription_from_stripe(stripe_sub, as_of: Optional[float] = None):
+    """
+    Create/update VpsSubscription row from a stripe.Subscription object.
+    `as_of` is when the object was fetched (defaults to the event's `created`);
+    a snapshot older than the stored one leaves the row untouched.
+
+    user_id and plan_id are NOT NULL: when neither the metadata, the customer
+    nor an existing row supplies them, the row is skipped with a warning
+    rather than failing (and rolling back) the whole event.
+    """
+    plan_code = subscription_plan_code(stripe_sub)
+    # Retired (inactive) plans still own the subscriptions sold on them
+    plan = VPSPlan.query.filter_by(plan_code=plan_code).first() if plan_code else None
+
+    values = vps_subscription_values(stripe_sub, plan.id if plan else None, _source_event_at(as_of))
+    if values["user_id"] is None:
+        values["user_id"] = _find_user_by_customer(stripe_sub.get("customer"))
+    if values["user_id"] is None or values["plan_id"] is None:
+        stored = (
+            db.session.query(VpsSubscription.user_id, VpsSubscription.plan_id)
+            .filter_by(stripe_subscription_id=stripe_sub["id"])
+            .first()
+        )
+        if stored:
+            values["user_id"] = values["user_id"] or stored.user_id
+            values["plan_id"] = values["plan_id"] or stored.plan_id
+    if values["user_id"] is None or values["plan_id"] is None:
+        missing = "user" if values["user_id"] is None else f"plan for plan_code {plan_code!r}"
+        log.warning(f"Subscription {stripe_sub['id']}: no local {missing}; VpsSubscription not written")
+        return None
+
+    return upsert_one(VpsSubscription, values, "stripe_subscription_id", **VPS_SUBSCRIPTION_UPSERT)
+
+
+def ordering_key(event: dict) -> str:
+    """
+    Events that touch the same Stripe object must be applied in order.
+    Everything hangs off a subscription here, so group by it when present,
+    then by customer, then by the object itself.
+    """
+    obj = (event.get("data") or {}).get("object") or {}
+    if obj.get("object") == "subscription" and obj.get("id"):
+        return obj["id"]
+    sub = obj.get("subscription")
+    if isinstance(sub, dict):
+        sub = sub.get("id")
+    return sub or obj.get("customer") or obj.get("id") or event.get("id")
+
+
+def checkout_room(session_id: str) -> str:
+    return f"checkout_{session_id}"
+
+
+def _publish_checkout_state(session_id: Optional[str], state: str, invoice_id: Optional[str] = None) -> None:
+    """Tell a waiting success_pending page its outcome (sent after commit)."""
+    if not session_id:
+        return
+    payload = {"session_id": session_id, "state": state, "invoice_id": invoice_id}
+    _uow().after_commit.append(
+        lambda: socketio.emit("checkout_state", payload, room=checkout_room(session_id))
+    )
+
+
+def _record_checkout_state(sess: dict, state: str, livemode: bool) -> None:
+    client_ref = sess.get('client_reference_id')
+    user_id = _find_user_by_customer(sess.get('customer')) or (int(client_ref) if str(client_ref or '').isdigit() else None)
+    upsert_session_state(
+        sess['id'], state,
+        user_id=user_id,
+        subscription_id=sess.get('subscription'),
+        invoice_id=sess.get('invoice'),
+        payment_status=sess.get('payment_status'),
+        livemode=livemode,
+    )
+
+
+# ---- Dispatch ----
+# event type -> handler(event, livemode). The keys double as the webhook's
+# allow-list: any other type is acked without being logged (see is_handled).
+HANDLERS: Dict[str, Callable[[dict, bool], None]] = {}
+
+
+def handles(*etypes: str):
+    def register(fn):
+        for etype in etypes:
+            HANDLERS[etype] = fn
+        return fn
+    return register
+
+
+def is_handled(etype: str) -> bool:
+    return etype in HANDLERS
+
+
+@handles("checkout.session.completed")
+def _on_checkout_completed(event: dict, livemode: bool) -> None:
+    session = event["data"]["object"]
+    _upsert_checkout_session(session, livemode)
+
+    sub_id = session.get("subscription")
+    if sub_id:
+        # Stamped with the snapshot's own time, not the (possibly late) event's
+        sub, as_of = _subscription_for_event(sub_id)
+        _upsert_subscription_from_stripe(sub, as_of)
+        _upsert_subscription_record(sub, livemode, as_of)
+
+    # Card payments settle before completion; async methods report later
+    paid = session.get("payment_status") in ("paid", "no_payment_required")
+    _record_checkout_state(session, "paid" if paid else "pending", livemode)
+    if paid:
+        _publish_checkout_state(session["id"], "paid")
+
+
+@handles("checkout.session.async_payment_succeeded", "checkout.session.async_payment_failed")
+def _on_checkout_async_payment(event: dict, livemode: bool) -> None:
+    session = event["data"]["object"]
+    _upsert_checkout_session(session, livemode)
+    state = "paid" if event["type"].endswith("succeeded") else "failed"
+    _record_checkout_state(session, state, livemode)
+    _publish_checkout_state(session["id"], state)
+
+
+@handles("customer.subscription.created", "customer.subscription.updated", "customer.subscription.deleted")
+def _on_subscription_changed(event: dict, livemode: bool) -> None:
+    sub_obj = event["data"]["object"]
+    as_of = None
+    if not (isinstance(sub_obj, dict) and sub_obj.get("items", {}).get("data")):
+        if _is_stale(sub_obj["id"]):
+            # A newer event already landed; don't pay a Stripe round-trip for nothing
+            return
+        sub, as_of = _subscription_for_event(sub_obj["id"])
+    else:
+        # Full payload: write through so later lookups skip Stripe
+        put_subscription(sub_obj, as_of=event.get("created"))
+        sub = sub_obj
+    # Older than what we hold -> the conditional upserts are no-ops
+    _upsert_subscription_from_stripe(sub, as_of)
+    _upsert_subscription_record(sub, livemode, as_of)
+
+
+@handles("invoice.finalized", "invoice.payment_succeeded", "invoice.paid", "invoice.voided",
+         "invoice.marked_uncollectible")
+def _on_invoice(event: dict, livemode: bool) -> None:
+    inv = event["data"]["object"]
+    _upsert_invoice_record(inv, livemode)
+
+    if event["type"] in ("invoice.paid", "invoice.payment_succeeded") and inv.get("billing_reason") == "subscription_create":
+        session_id = advance_subscription_state(inv.get("subscription"), "paid", inv.get("id"))
+        _publish_checkout_state(session_id, "paid", inv.get("id"))
+
+
+@handles("invoice.payment_failed")
+def _on_invoice_payment_failed(event: dict, livemode: bool) -> None:
+    inv = event["data"]["object"]
+    if inv.get("billing_reason") == "subscription_create":
+        session_id = advance_subscription_state(inv.get("subscription"), "failed", inv.get("id"))
+        _publish_checkout_state(session_id, "failed", inv.get("id"))
+
+
+def handle_event(event: dict) -> None:
+    """
+    Apply a verified Stripe event to our tables.
+    Raises on failure so the caller can keep the log row unprocessed.
+    """
+    handler = HANDLERS.get(event["type"])
+    if handler is None:
+        return  # logged before it left the allow-list (old rows, replays)
+    if event.get("created"):
+        _uow().event_at = datetime.utcfromtimestamp(event["created"])
+    handler(event, bool(event.get("livemode")))
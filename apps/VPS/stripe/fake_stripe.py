@@ -0,0 +1,368 @@
+# apps/VPS/stripe/fake_stripe.py
+"""
+Offline Stripe stand-in for benchmarks, local runs and the reconciler.
+
+Serves prices, customers, subscriptions, invoices and checkout sessions from
+in-memory fixtures (built from the plan catalog, or loaded from a recorded
+JSON file). It can also produce realistic event sequences and sign them
+exactly like Stripe does, so `stripe.Webhook.construct_event` accepts them.
+
+    fake = FakeStripe.from_plans(VPS_PLANS)
+    with fake.installed():              # stripe.Price / Subscription / ... now served locally
+        events = fake.signup_events(user_id=42, plan_code="nebula_one", interval="month")
+        body = json.dumps(events[0]).encode()
+        header = sign_payload(body, "whsec_test")
+
+Only the calls this app makes are implemented. Objects support both
+obj["key"] and obj.key, like the SDK's StripeObject.
+"""
+
+import hmac
+import json
+import time
+import uuid
+import hashlib
+import itertools
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Dict, Any, List, Optional, Iterable
+
+import stripe
+
+TEST_WEBHOOK_SECRET = "whsec_offline_test_secret"
+
+
+def sign_payload(payload: bytes, secret: str = TEST_WEBHOOK_SECRET, timestamp: Optional[int] = None) -> str:
+    """Stripe-Signature header value for `payload` (t=<ts>,v1=<hmac-sha256>)."""
+    ts = int(timestamp if timestamp is not None else time.time())
+    signed = f"{ts}.".encode() + payload
+    v1 = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={ts},v1={v1}"
+
+
+class FakeObject(dict):
+    """dict with attribute access, recursively (what call sites expect from the SDK)."""
+
+    def __init__(self, values=None, **kw):
+        super().__init__()
+        for k, v in dict(values or {}, **kw).items():
+            self[k] = _wrap(v)
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def _wrap(v):
+    if isinstance(v, dict) and not isinstance(v, FakeObject):
+        return FakeObject(v)
+    if isinstance(v, list):
+        return [_wrap(x) for x in v]
+    return v
+
+
+def _public(o: dict) -> "FakeObject":
+    """Served copy of a stored object (bookkeeping keys starting with '_' stripped)."""
+    return FakeObject({k: v for k, v in o.items() if not k.startswith("_")})
+
+
+def _plain(v):
+    """Deep copy back to plain JSON types (payloads, fixture files)."""
+    if isinstance(v, dict):
+        return {k: _plain(x) for k, x in v.items()}
+    if isinstance(v, list):
+        return [_plain(x) for x in v]
+    return v
+
+
+class FakeList(FakeObject):
+    """A Stripe list page; auto_paging_iter() walks the rest without network."""
+
+    def __init__(self, items: List[dict], limit: int = 10, url: str = ""):
+        super().__init__({"object": "list", "url": url, "has_more": len(items) > limit})
+        self["data"] = items[:limit]
+        self._all = items
+
+    def auto_paging_iter(self):
+        return iter(self._all)
+
+
+class _Resource:
+    """In-memory collection with the list() filters the app uses."""
+
+    def __init__(self, fake: "FakeStripe", prefix: str, store: Dict[str, dict]):
+        self._fake = fake
+        self._prefix = prefix
+        self._store = store
+
+    def retrieve(self, id, expand=None, **_):
+        self._fake.calls[f"{self._prefix}.retrieve"] += 1
+        try:
+            return _public(self._store[id])
+        except KeyError:
+            raise stripe.InvalidRequestError(f"No such {self._prefix}: '{id}'", "id", code="resource_missing")
+
+    def list(self, limit=10, created=None, starting_after=None, customer=None, status=None, **_):
+        self._fake.calls[f"{self._prefix}.list"] += 1
+        items = sorted(self._store.values(), key=lambda o: (o.get("created") or 0, o["id"]), reverse=True)
+        if customer:
+            items = [o for o in items if o.get("customer") == customer]
+        if status and status != "all":
+            items = [o for o in items if o.get("status") == status]
+        if isinstance(created, dict) and created.get("gte") is not None:
+            items = [o for o in items if (o.get("created") or 0) >= created["gte"]]
+        if starting_after:
+            ids = [o["id"] for o in items]
+            items = items[ids.index(starting_after) + 1:] if starting_after in ids else []
+        return FakeList([_public(o) for o in items], limit=limit)
+
+
+class _Prices(_Resource):
+    def list(self, lookup_keys=None, active=None, limit=10, **kw):
+        self._fake.calls["price.list"] += 1
+        items = list(self._store.values())
+        if lookup_keys:
+            items = [p for p in items if p.get("lookup_key") in set(lookup_keys)]
+        if active is not None:
+            items = [p for p in items if bool(p.get("active")) == bool(active)]
+        return FakeList([FakeObject(p) for p in items], limit=limit)
+
+
+class _Customers(_Resource):
+    def create(self, email=None, metadata=None, idempotency_key=None, **_):
+        self._fake.calls["customer.create"] += 1
+        if idempotency_key and idempotency_key in self._fake.idempotent:
+            return _public(self._store[self._fake.idempotent[idempotency_key]])
+        cus = self._fake.add_customer(email=email, metadata=metadata)
+        if idempotency_key:
+            self._fake.idempotent[idempotency_key] = cus["id"]
+        return _public(cus)
+
+
+class _CheckoutSessions(_Resource):
+    def create(self, customer=None, line_items=None, client_reference_id=None, subscription_data=None, **_):
+        self._fake.calls["checkout.session.create"] += 1
+        price = self._fake.prices[line_items[0]["price"]]
+        sess = self._fake._new_session(customer, client_reference_id, price, (subscription_data or {}).get("metadata"))
+        return _public(sess)
+
+
+class _PortalSessions:
+    def __init__(self, fake: "FakeStripe"):
+        self._fake = fake
+
+    def create(self, customer=None, return_url=None, **_):
+        self._fake.calls["billing_portal.session.create"] += 1
+        return FakeObject(id=self._fake._id("bps"), object="billing_portal.session", customer=customer,
+                          return_url=return_url, url=f"https://billing.stripe.invalid/p/session/{customer}")
+
+
+class FakeStripe:
+    """Fixture-backed replacement for the parts of the `stripe` module this app uses."""
+
+    def __init__(self, fixtures: Optional[Dict[str, Any]] = None, livemode: bool = False):
+        fixtures = fixtures or {}
+        self.livemode = livemode
+        self.prices: Dict[str, dict] = {p["id"]: p for p in fixtures.get("prices", [])}
+        self.customers: Dict[str, dict] = {c["id"]: c for c in fixtures.get("customers", [])}
+        self.subscriptions: Dict[str, dict] = {s["id"]: s for s in fixtures.get("subscriptions", [])}
+        self.invoices: Dict[str, dict] = {i["id"]: i for i in fixtures.get("invoices", [])}
+        self.sessions: Dict[str, dict] = {s["id"]: s for s in fixtures.get("checkout_sessions", [])}
+        self.idempotent: Dict[str, str] = {}
+        self.calls = _Counter()
+        self._seq = itertools.count(1)
+        self._clock = int(time.time()) - 3600
+
+        # Module-shaped surface (what `stripe.<Name>` resolves to once installed)
+        self.Price = _Prices(self, "price", self.prices)
+        self.Customer = _Customers(self, "customer", self.customers)
+        self.Subscription = _Resource(self, "subscription", self.subscriptions)
+        self.Invoice = _Resource(self, "invoice", self.invoices)
+        self.checkout = SimpleNamespace(Session=_CheckoutSessions(self, "checkout.session", self.sessions))
+        self.billing_portal = SimpleNamespace(Session=_PortalSessions(self))
+        self.Webhook = stripe.Webhook  # real verifier; it's pure HMAC, no network
+
+    # ---- fixtures ----
+
+    @classmethod
+    def from_plans(cls, plans: Iterable[dict], **kw) -> "FakeStripe":
+        """Prices for every plan's monthly/yearly lookup key (ids are stable: price_fx_<lookup_key>)."""
+        prices = []
+        for p in plans:
+            for interval, key, amount in (("month", p["stripe_lookup_key_monthly"], p["monthly_price"]),
+                                          ("year", p["stripe_lookup_key_yearly"], p["yearly_price"])):
+                prices.append({
+                    "id": f"price_fx_{key}", "object": "price", "active": True, "lookup_key": key,
+                    "currency": p.get("currency", "eur"), "unit_amount": int(round(amount * 100)),
+                    "nickname": f"{p['name']} ({interval}ly)", "recurring": {"interval": interval},
+                    "product": {"id": f"prod_fx_{p['plan_code']}", "object": "product", "name": p["name"]},
+                })
+        return cls({"prices": prices}, **kw)
+
+    @classmethod
+    def load(cls, path: str, **kw) -> "FakeStripe":
+        with open(path, "r", encoding="utf-8") as fh:
+            return cls(json.load(fh), **kw)
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump({
+                "prices": list(self.prices.values()),
+                "customers": list(self.customers.values()),
+                "subscriptions": list(self.subscriptions.values()),
+                "invoices": list(self.invoices.values()),
+                "checkout_sessions": list(self.sessions.values()),
+            }, fh, indent=1, default=str)
+
+    def price_for(self, plan_code: str, interval: str) -> dict:
+        for p in self.prices.values():
+            if p["product"]["id"] == f"prod_fx_{plan_code}" and p["recurring"]["interval"] == interval:
+                return p
+        raise KeyError(f"No fixture price for {plan_code}/{interval}")
+
+    # ---- object factories ----
+
+    def _id(self, prefix: str) -> str:
+        return f"{prefix}_fx_{uuid.uuid4().hex[:14]}{next(self._seq)}"
+
+    def _tick(self, seconds: int = 1) -> int:
+        self._clock += seconds
+        return self._clock
+
+    def add_customer(self, email: Optional[str] = None, metadata: Optional[dict] = None) -> dict:
+        cus = {"id": self._id("cus"), "object": "customer", "email": email, "metadata": _plain(metadata or {}),
+               "created": self._tick(), "livemode": self.livemode}
+        self.customers[cus["id"]] = cus
+        return cus
+
+    def _new_session(self, customer, client_reference_id, price, metadata) -> dict:
+        sess = {
+            "id": self._id("cs"), "object": "checkout.session", "mode": "subscription", "status": "open",
+            "payment_status": "unpaid", "customer": customer, "subscription": None, "invoice": None,
+            "client_reference_id": str(client_reference_id) if client_reference_id is not None else None,
+            "amount_total": price["unit_amount"], "currency": price["currency"], "payment_intent": None,
+            "created": self._tick(), "livemode": self.livemode,
+            "metadata": {}, "url": None,
+            "_price_id": price["id"], "_subscription_metadata": _plain(metadata or {}),
+        }
+        sess["url"] = f"https://checkout.stripe.invalid/c/pay/{sess['id']}"
+        self.sessions[sess["id"]] = sess
+        return sess
+
+    def _new_subscription(self, customer: str, price: dict, metadata: dict) -> dict:
+        now = self._tick()
+        period = 30 * 86400 if price["recurring"]["interval"] == "month" else 365 * 86400
+        sub = {
+            "id": self._id("sub"), "object": "subscription", "customer": customer, "status": "incomplete",
+            "metadata": _plain(metadata), "cancel_at_period_end": False, "created": now,
+            "billing_cycle_anchor": now, "current_period_start": now, "current_period_end": now + period,
+            "livemode": self.livemode, "latest_invoice": None,
+            "items": {"object": "list", "data": [{"id": self._id("si"), "object": "subscription_item",
+                                                   "price": _plain(price), "quantity": 1}]},
+        }
+        self.subscriptions[sub["id"]] = sub
+        return sub
+
+    def _new_invoice(self, sub: dict, billing_reason: str) -> dict:
+        price = sub["items"]["data"][0]["price"]
+        inv = {
+            "id": self._id("in"), "object": "invoice", "customer": sub["customer"], "subscription": sub["id"],
+            "status": "open", "billing_reason": billing_reason, "amount_due": price["unit_amount"],
+            "amount_paid": 0, "amount_remaining": price["unit_amount"], "currency": price["currency"],
+            "payment_intent": self._id("pi"), "created": self._tick(), "livemode": self.livemode,
+            "hosted_invoice_url": None, "invoice_pdf": None, "description": None,
+            "subscription_details": {"metadata": _plain(sub.get("metadata") or {})},
+            "lines": {"object": "list", "data": [{
+                "description": f"1 × {price.get('nickname') or price['id']}",
+                "period": {"start": sub["current_period_start"], "end": sub["current_period_end"]},
+            }]},
+        }
+        inv["hosted_invoice_url"] = f"https://invoice.stripe.invalid/i/{inv['id']}"
+        inv["invoice_pdf"] = inv["hosted_invoice_url"] + "/pdf"
+        self.invoices[inv["id"]] = inv
+        return inv
+
+    # ---- events ----
+
+    def event(self, etype: str, obj: dict, created: Optional[int] = None) -> Dict[str, Any]:
+        """A Stripe event envelope around a snapshot of `obj` (plain JSON)."""
+        snapshot = _plain(_public(obj))
+        return {
+            "id": self._id("evt"), "object": "event", "api_version": "2024-06-20",
+            "created": created if created is not None else self._tick(), "livemode": self.livemode,
+            "pending_webhooks": 1, "request": {"id": None, "idempotency_key": None},
+            "type": etype, "data": {"object": snapshot},
+        }
+
+    def signup_events(self, user_id: int, plan_code: str, interval: str = "month",
+                      customer: Optional[str] = None, email: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        The events one successful card checkout produces, in Stripe's usual order:
+        customer.subscription.created, invoice.finalized, invoice.paid,
+        invoice.payment_succeeded, customer.subscription.updated (-> active),
+        checkout.session.completed.
+        """
+        customer = customer or self.add_customer(email=email, metadata={"user_id": user_id})["id"]
+        price = self.price_for(plan_code, interval)
+        metadata = {"user_id": str(user_id), "plan_code": plan_code, "interval": interval}
+        sess = self._new_session(customer, user_id, price, metadata)
+        sub = self._new_subscription(customer, price, metadata)
+        inv = self._new_invoice(sub, "subscription_create")
+
+        events = [self.event("customer.subscription.created", sub)]
+        inv["status"] = "open"
+        events.append(self.event("invoice.finalized", inv))
+        inv.update(status="paid", amount_paid=inv["amount_due"], amount_remaining=0)
+        events.append(self.event("invoice.paid", inv))
+        events.append(self.event("invoice.payment_succeeded", inv))
+        sub.update(status="active", latest_invoice=inv["id"])
+        events.append(self.event("customer.subscription.updated", sub))
+        sess.update(status="complete", payment_status="paid", subscription=sub["id"], invoice=inv["id"])
+        events.append(self.event("checkout.session.completed", sess))
+        return events
+
+    def renewal_events(self, sub_id: str, fail: bool = False) -> List[Dict[str, Any]]:
+        """Next billing cycle for an existing subscription (paid, or failed -> past_due)."""
+        sub = self.subscriptions[sub_id]
+        span = sub["current_period_end"] - sub["current_period_start"]
+        sub["current_period_start"], sub["current_period_end"] = sub["current_period_end"], sub["current_period_end"] + span
+        inv = self._new_invoice(sub, "subscription_cycle")
+        events = [self.event("invoice.finalized", inv)]
+        if fail:
+            events.append(self.event("invoice.payment_failed", inv))
+            sub["status"] = "past_due"
+        else:
+            inv.update(status="paid", amount_paid=inv["amount_due"], amount_remaining=0)
+            events.append(self.event("invoice.paid", inv))
+        events.append(self.event("customer.subscription.updated", sub))
+        return events
+
+    def noise_event(self) -> Dict[str, Any]:
+        """A type this app doesn't handle (Stripe sends plenty of these)."""
+        etype = ("payment_intent.created", "charge.succeeded", "payment_method.attached",
+                 "customer.updated", "invoiceitem.created")[next(self._seq) % 5]
+        return self.event(etype, {"id": self._id("obj"), "object": etype.split(".")[0]})
+
+    # ---- installation ----
+
+    @contextmanager
+    def installed(self):
+        """Route `stripe.<Resource>` calls made anywhere in the app to this stand-in."""
+        names = ("Price", "Customer", "Subscription", "Invoice", "checkout", "billing_portal")
+        saved = {n: getattr(stripe, n) for n in names}
+        try:
+            for n in names:
+                setattr(stripe, n, getattr(self, n))
+            yield self
+        finally:
+            for n, v in saved.items():
+                setattr(stripe, n, v)
+
+
+class _Counter(dict):
+    """Per-call-name counters (how many Stripe round-trips a run would have cost)."""
+
+    def __missing__(self, key):
+        return 0
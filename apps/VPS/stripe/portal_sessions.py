@@ -0,0 +1,64 @@
+# apps/VPS/stripe/portal_sessions.py
+"""
+Reuse of Stripe Billing Portal session URLs.
+
+A portal session URL stays usable for a few minutes after creation, so repeat
+clicks inside that window are answered from memory instead of a blocking
+Stripe call. Entries are timed from the session's own `created` and dropped a
+safety margin before Stripe would expire them.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+import stripe
+from apps.VPS.stripe.client import configure_stripe
+
+# Shared, pooled Stripe client (API key, timeouts, retries, breaker)
+configure_stripe()
+
+# Stripe portal sessions are short-lived (~5 min); stay well inside that
+TTL_SECONDS = float(os.getenv("STRIPE_PORTAL_SESSION_TTL", "240"))
+MAX_ENTRIES = int(os.getenv("STRIPE_PORTAL_CACHE_MAX", "1024"))
+
+# (customer_id, return_url) -> (expires_at, url)
+_CACHE: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _now() -> float:
+    return time.time()
+
+
+def get_portal_url(customer_id: str, return_url: str) -> str:
+    """Cached portal URL for this customer, or a freshly created one."""
+    key = (customer_id, return_url)
+    with _LOCK:
+        hit = _CACHE.get(key)
+        if hit and hit[0] > _now():
+            _CACHE.move_to_end(key)
+            return hit[1]
+        _CACHE.pop(key, None)
+
+    session = stripe.billing_portal.Session.create(customer=customer_id, return_url=return_url)
+    expires_at = (session.get("created") or _now()) + TTL_SECONDS
+
+    with _LOCK:
+        _CACHE[key] = (expires_at, session.url)
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > MAX_ENTRIES:
+            _CACHE.popitem(last=False)
+    return session.url
+
+
+def invalidate(customer_id: str = None) -> None:
+    """Drop a customer's cached sessions (or all when customer_id is None)."""
+    with _LOCK:
+        if customer_id is None:
+            _CACHE.clear()
+            return
+        for key in [k for k in _CACHE if k[0] == customer_id]:
+            _CACHE.pop(key, None)
@@ -0,0 +1,240 @@
+# apps/VPS/stripe/reconcile.py
+"""
+Rebuild VpsSubscription / BillingRecord from Stripe without waiting for webhooks.
+
+Pages through subscriptions, invoices and checkout sessions with
+`auto_paging_iter` and writes them with multi-row upserts (`upsert_many`),
+`batch_size` objects per statement. Rows are built by the same helpers the
+webhook handlers use, so both paths produce identical rows.
+
+Progress is checkpointed per resource in StripeSyncCursor after every batch:
+an interrupted run resumes from the last written object id with the same
+filter. A completed run records its start time as the watermark; the next
+incremental run only lists objects created since then. Stripe can't filter
+lists by "updated", so changes to older objects are only caught by a `full`
+run (cheap enough nightly at our volumes).
+
+`api` defaults to the `stripe` module; anything exposing
+Subscription.list / Invoice.list / checkout.Session.list whose results have
+auto_paging_iter() works (e.g. a recorded-fixture stand-in).
+"""
+
+import os
+import calendar
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+import stripe
+
+from extensions import db
+from apps.Users.models import User
+from apps.VPS.models import BillingRecord, VpsSubscription, VPSPlan, StripeSyncCursor
+from apps.VPS.stripe.client import configure_stripe
+from apps.VPS.stripe.upserts import upsert_many
+from apps.VPS.stripe.events import (
+    INVOICE_UPSERT, CHECKOUT_SESSION_UPSERT, SUBSCRIPTION_RECORD_UPSERT, VPS_SUBSCRIPTION_UPSERT,
+    invoice_values, checkout_session_values, subscription_record_values, vps_subscription_values,
+    subscription_plan_code,
+)
+
+# Shared, pooled Stripe client (API key, timeouts, retries, breaker)
+configure_stripe()
+
+log = logging.getLogger(__name__)
+
+RESOURCES = ("subscriptions", "invoices", "checkout_sessions")
+
+BATCH_SIZE = int(os.getenv("STRIPE_SYNC_BATCH_SIZE", "500"))
+PAGE_SIZE = 100  # Stripe's max per list call
+
+
+def _list(api, resource: str, params: Dict[str, Any]):
+    if resource == "subscriptions":
+        return api.Subscription.list(status="all", **params)  # include canceled
+    if resource == "invoices":
+        return api.Invoice.list(**params)
+    if resource == "checkout_sessions":
+        return api.checkout.Session.list(**params)
+    raise ValueError(f"Unknown resource '{resource}'")
+
+
+def _epoch(dt: datetime) -> int:
+    return calendar.timegm(dt.utctimetuple())
+
+
+def _int_or_none(value) -> Optional[int]:
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _get_cursor(resource: str) -> StripeSyncCursor:
+    cursor = StripeSyncCursor.query.filter_by(resource=resource).first()
+    if cursor is None:
+        cursor = StripeSyncCursor(resource=resource, synced_count=0)
+        db.session.add(cursor)
+    return cursor
+
+
+def _users_by_customer(objs: Iterable[dict]) -> Dict[str, int]:
+    """One query per batch instead of one per object."""
+    ids = {o.get("customer") for o in objs if o.get("customer")}
+    if not ids:
+        return {}
+    rows = db.session.query(User.stripe_customer_id, User.id).filter(User.stripe_customer_id.in_(ids)).all()
+    return dict(rows)
+
+
+def _dedupe(rows: List[Dict[str, Any]], key: str) -> List[Dict[str, Any]]:
+    # ON CONFLICT can't touch the same row twice in one statement; last one wins
+    return list({r[key]: r for r in rows}.values())
+
+
+def _write_batch(resource: str, objs: List[dict], stamp: datetime, plan_ids: Dict[str, int]) -> Tuple[int, int]:
+    """
+    Upsert one batch. Returns (objects written, subscriptions whose plan_code
+    matches no VPSPlan); objects not written had no local owner.
+    """
+    users = _users_by_customer(objs)
+    billing_rows, vps_rows = [], []
+    no_plan = 0
+
+    for o in objs:
+        livemode = bool(o.get("livemode"))
+        user_id = users.get(o.get("customer"))
+
+        if resource == "subscriptions":
+            md_user = _int_or_none((o.get("metadata") or {}).get("user_id"))
+            user_id = user_id or md_user
+            if not user_id or not (o.get("items") or {}).get("data"):
+                continue
+            billing_rows.append(subscription_record_values(o, livemode, user_id, stamp))
+            plan_code = subscription_plan_code(o)
+            plan_id = plan_ids.get(plan_code)
+            if plan_id:
+                row = vps_subscription_values(o, plan_id, stamp)
+                row["user_id"] = md_user or user_id
+                vps_rows.append(row)
+            else:
+                # vps_subscriptions.plan_id is NOT NULL: billing record only
+                no_plan += 1
+                log.warning(f"Stripe sync: subscription {o.get('id')} has unknown plan_code {plan_code!r}; "
+                            f"VpsSubscription not written")
+
+        elif resource == "invoices":
+            sub_md = (o.get("subscription_details") or {}).get("metadata") or {}
+            user_id = user_id or _int_or_none(sub_md.get("user_id"))
+            if not user_id or not o.get("customer"):
+                continue
+            billing_rows.append(invoice_values(o, livemode, user_id, stamp))
+
+        else:
+            user_id = user_id or _int_or_none(o.get("client_reference_id"))
+            if not user_id:
+                continue
+            billing_rows.append(checkout_session_values(o, livemode, user_id, stamp))
+
+    opts = {
+        "subscriptions": SUBSCRIPTION_RECORD_UPSERT,
+        "invoices": INVOICE_UPSERT,
+        "checkout_sessions": CHECKOUT_SESSION_UPSERT,
+    }[resource]
+    upsert_many(BillingRecord, _dedupe(billing_rows, "stripe_id"), "stripe_id", **opts)
+    upsert_many(VpsSubscription, _dedupe(vps_rows, "stripe_subscription_id"), "stripe_subscription_id",
+                **VPS_SUBSCRIPTION_UPSERT)
+    return len(billing_rows), no_plan
+
+
+def sync_resource(
+    resource: str,
+    *,
+    since: Optional[datetime] = None,
+    full: bool = False,
+    resume: bool = True,
+    batch_size: int = BATCH_SIZE,
+    api=None,
+) -> Dict[str, int]:
+    """
+    Reconcile one resource. `since` overrides the stored watermark; `full`
+    ignores it. Returns {"seen": n, "written": n, "skipped": n, "no_plan": n};
+    no_plan counts subscriptions written as billing records only because
+    their plan_code matches no VPSPlan.
+    """
+    api = api or stripe
+    cursor = _get_cursor(resource)
+    starting_after = None
+
+    if resume and cursor.run_started_at and not cursor.completed_at:
+        # Unfinished run: continue it with the filter it started with
+        since, starting_after = cursor.run_since, cursor.starting_after
+        log.info(f"Resuming Stripe sync of {resource} after {starting_after} (since={since})")
+    else:
+        if since is None and not full:
+            since = cursor.watermark
+        cursor.run_since = since
+        cursor.run_started_at = datetime.utcnow()
+        cursor.starting_after = None
+        cursor.completed_at = None
+        cursor.synced_count = 0
+        db.session.commit()
+
+    params: Dict[str, Any] = {"limit": PAGE_SIZE}
+    if since:
+        params["created"] = {"gte": _epoch(since)}
+    if starting_after:
+        params["starting_after"] = starting_after
+
+    # Same resolution as the webhook: any plan, retired ones included
+    plan_ids = dict(db.session.query(VPSPlan.plan_code, VPSPlan.id).all())
+    stats = {"seen": 0, "written": 0, "skipped": 0, "no_plan": 0}
+    batch: List[dict] = []
+    stamp = datetime.utcnow()
+
+    def flush():
+        nonlocal batch, stamp
+        if not batch:
+            return
+        written, no_plan = _write_batch(resource, batch, stamp, plan_ids)
+        stats["seen"] += len(batch)
+        stats["written"] += written
+        stats["skipped"] += len(batch) - written
+        stats["no_plan"] += no_plan
+        cursor.starting_after = batch[-1]["id"]
+        cursor.synced_count = (cursor.synced_count or 0) + written
+        db.session.commit()  # checkpoint: data and cursor move together
+        batch = []
+        stamp = datetime.utcnow()
+
+    # Every row is stamped with (no later than) its fetch time, so newer webhook events still win
+    for obj in _list(api, resource, params).auto_paging_iter():
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    cursor.watermark = cursor.run_started_at
+    cursor.completed_at = datetime.utcnow()
+    cursor.starting_after = None
+    db.session.commit()
+    return stats
+
+
+def reconcile(
+    resources: Iterable[str] = RESOURCES,
+    *,
+    since: Optional[datetime] = None,
+    full: bool = False,
+    resume: bool = True,
+    batch_size: int = BATCH_SIZE,
+    api=None,
+) -> Dict[str, Dict[str, int]]:
+    """Run sync_resource for each resource in order; returns per-resource stats."""
+    results = {}
+    for resource in resources:
+        results[resource] = sync_resource(
+            resource, since=since, full=full, resume=resume, batch_size=batch_size, api=api
+        )
+        log.info(f"Stripe sync {resource}: {results[resource]}")
+    return results
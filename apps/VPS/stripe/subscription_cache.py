@@ -0,0 +1,87 @@
+# apps/VPS/stripe/subscription_cache.py
+"""
+Bounded, TTL'd in-process cache of Stripe Subscription objects keyed by id.
+
+Webhook `customer.subscription.*` payloads write through via
+`put_subscription`, so most lookups from the webhook handlers and the checkout
+status page are served from memory; Stripe is only called on a miss.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+import stripe
+from apps.VPS.stripe.client import configure_stripe
+
+# Shared, pooled Stripe client (API key, timeouts, retries, breaker)
+configure_stripe()
+
+# Same expansions the call sites used to request individually
+SUBSCRIPTION_EXPAND = ["items.data.price.product", "latest_invoice.payment_intent"]
+
+MAX_ENTRIES = int(os.getenv("STRIPE_SUB_CACHE_MAX", "2048"))
+TTL_SECONDS = float(os.getenv("STRIPE_SUB_CACHE_TTL", "300"))
+
+# sub_id -> (expires_at, as_of, obj); OrderedDict doubles as LRU order
+_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _now() -> float:
+    return time.time()
+
+
+def put_subscription(sub_obj: Dict[str, Any], as_of: Optional[float] = None) -> None:
+    """
+    Store a full subscription object. `as_of` is the Stripe event `created`
+    time for webhook payloads; an older snapshot never replaces a newer one.
+    """
+    if not (isinstance(sub_obj, dict) and sub_obj.get("id") and (sub_obj.get("items") or {}).get("data")):
+        return  # slim payloads are not worth caching
+    as_of = as_of if as_of is not None else _now()
+    sub_id = sub_obj["id"]
+    with _LOCK:
+        current = _CACHE.get(sub_id)
+        if current and current[1] > as_of and current[0] > _now():
+            return
+        _CACHE[sub_id] = (_now() + TTL_SECONDS, as_of, sub_obj)
+        _CACHE.move_to_end(sub_id)
+        while len(_CACHE) > MAX_ENTRIES:
+            _CACHE.popitem(last=False)
+
+
+def get_subscription_snapshot(sub_id: str, refresh: bool = False) -> Tuple[Dict[str, Any], float]:
+    """
+    (subscription, as_of): as_of is the event `created` time for webhook
+    write-throughs, or the fetch time for objects retrieved from Stripe.
+    """
+    if not refresh:
+        with _LOCK:
+            hit = _CACHE.get(sub_id)
+            if hit and hit[0] > _now():
+                _CACHE.move_to_end(sub_id)
+                return hit[2], hit[1]
+            if hit:
+                _CACHE.pop(sub_id, None)
+
+    fetched_at = _now()
+    sub = stripe.Subscription.retrieve(sub_id, expand=SUBSCRIPTION_EXPAND)
+    put_subscription(sub, as_of=fetched_at)
+    return sub, fetched_at
+
+
+def get_subscription(sub_id: str, refresh: bool = False) -> Dict[str, Any]:
+    """Cached subscription; falls back to stripe.Subscription.retrieve on a miss."""
+    return get_subscription_snapshot(sub_id, refresh=refresh)[0]
+
+
+def invalidate(sub_id: Optional[str] = None) -> None:
+    """Drop one entry, or everything when sub_id is None."""
+    with _LOCK:
+        if sub_id is None:
+            _CACHE.clear()
+        else:
+            _CACHE.pop(sub_id, None)
@@ -1,9 +1,35 @@
-import os, stripe
-stripe.api_key = "sk_test_YCyV7XZxehnH1Sx3wKK0oZ2o"
+# apps/VPS/stripe/test_mode_verify.py
+"""
+Print the Price each plan lookup key resolves to.
+
+    python -m apps.VPS.stripe.test_mode_verify            # uses STRIPE_SECRET_KEY (test mode)
+    python -m apps.VPS.stripe.test_mode_verify --offline  # fixture stand-in, no network
+"""
+import sys
+import stripe
+
+from apps.VPS.stripe.client import configure_stripe
+from apps.VPS.vps_catalog import VPS_PLANS
+from apps.VPS.stripe.fake_stripe import FakeStripe
+
+# Shared, pooled Stripe client (API key, timeouts, retries, breaker)
+configure_stripe()
 
 def get_price_by_lookup(lk):
     res = stripe.Price.list(lookup_keys=[lk], active=True, limit=1, expand=["data.product"])
     return None if not res.data else {"price_id": res.data[0].id, "interval": res.data[0].recurring.interval, "product": res.data[0].product.name}
 
-print("nebula_one monthly:", get_price_by_lookup("nebula_one_monthly"))
-print("nebula_one yearly :", get_price_by_lookup("nebula_one_yearly"))
+def main():
+    def run():
+        for p in VPS_PLANS:
+            print(f"{p['plan_code']} monthly:", get_price_by_lookup(p["stripe_lookup_key_monthly"]))
+            print(f"{p['plan_code']} yearly :", get_price_by_lookup(p["stripe_lookup_key_yearly"]))
+
+    if "--offline" in sys.argv:
+        with FakeStripe.from_plans(VPS_PLANS).installed():
+            run()
+    else:
+        run()
+
+if __name__ == "__main__":
+    main()
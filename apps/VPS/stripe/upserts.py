@@ -0,0 +1,76 @@
+# apps/VPS/stripe/upserts.py
+"""
+PostgreSQL INSERT ... ON CONFLICT DO UPDATE helpers for Stripe-mirrored rows.
+
+One statement per write instead of SELECT-then-INSERT, and safe under
+concurrent deliveries of the same Stripe object (no duplicate-key races).
+"""
+
+from typing import Iterable, Sequence, Dict, Any, List, Optional
+
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from extensions import db
+
+
+def upsert_stmt(
+    model,
+    rows: Sequence[Dict[str, Any]],
+    key: str,
+    *,
+    fill_if_null: Iterable[str] = (),
+    keep_if_null: Iterable[str] = (),
+    insert_only: Iterable[str] = (),
+    newer_than: Optional[str] = None,
+):
+    """
+    Build a (multi-row) upsert for `model` keyed on the unique column `key`.
+
+    - fill_if_null: existing value wins; only set when the stored value is NULL
+    - keep_if_null: incoming value wins unless it is NULL (keep what we have)
+    - insert_only:  written on insert, never touched on conflict
+    - newer_than:   timestamp column; the conflicting row is only updated when
+                    the incoming value is >= the stored one (or it is NULL),
+                    so a late, older event becomes a no-op
+    Every other supplied column is overwritten with the incoming value.
+    All rows must carry the same keys.
+    """
+    fill_if_null, keep_if_null, insert_only = set(fill_if_null), set(keep_if_null), set(insert_only)
+    stmt = pg_insert(model).values(list(rows))
+    excluded = stmt.excluded
+    table = model.__table__
+
+    set_ = {}
+    for col in rows[0].keys():
+        if col == key or col in insert_only:
+            continue
+        if col in fill_if_null:
+            set_[col] = func.coalesce(table.c[col], excluded[col])
+        elif col in keep_if_null:
+            set_[col] = func.coalesce(excluded[col], table.c[col])
+        else:
+            set_[col] = excluded[col]
+
+    where = None
+    if newer_than:
+        where = or_(table.c[newer_than].is_(None), table.c[newer_than] <= excluded[newer_than])
+
+    return stmt.on_conflict_do_update(index_elements=[table.c[key]], set_=set_, where=where)
+
+
+def upsert_one(model, values: Dict[str, Any], key: str, **opts) -> Optional[int]:
+    """
+    Upsert a single row and return its primary key (one round-trip).
+    None when a `newer_than` guard skipped the update.
+    """
+    stmt = upsert_stmt(model, [values], key, **opts).returning(model.__table__.c.id)
+    return db.session.execute(stmt).scalar()
+
+
+def upsert_many(model, rows: List[Dict[str, Any]], key: str, **opts) -> int:
+    """Upsert a batch of rows in one statement; returns the number of rows sent."""
+    if not rows:
+        return 0
+    db.session.execute(upsert_stmt(model, rows, key, **opts))
+    return len(rows)
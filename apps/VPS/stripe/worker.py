@@ -0,0 +1,147 @@
+# apps/VPS/stripe/worker.py
+"""
+Worker pool that drains StripeEventLog.
+
+The webhook route acks Stripe as soon as the event is verified and logged.
+These workers (green threads under eventlet) claim unprocessed rows with
+SELECT ... FOR UPDATE SKIP LOCKED, so several workers never handle the same
+event, and run the (slow, Stripe-calling) handlers off the HTTP path.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import or_
+
+from extensions import db, socketio
+from apps.common import metrics
+from apps.VPS.models import StripeEventLog
+from apps.VPS.stripe.events import handle_event, event_unit_of_work
+
+log = logging.getLogger(__name__)
+
+WORKER_COUNT = int(os.getenv("STRIPE_EVENT_WORKERS", "2"))
+POLL_SECONDS = float(os.getenv("STRIPE_EVENT_POLL_SECONDS", "5"))
+MAX_ATTEMPTS = int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS", "8"))
+
+_wake = threading.Event()
+_started = False
+_start_lock = threading.Lock()
+
+
+def _backoff(attempts: int) -> timedelta:
+    """30s, 1m, 2m, 4m ... capped at 1h."""
+    return timedelta(seconds=min(30 * (2 ** max(attempts - 1, 0)), 3600))
+
+
+def _claim_next():
+    """Lock the oldest due, unprocessed event (skipping rows other workers hold)."""
+    now = datetime.utcnow()
+    return (
+        StripeEventLog.query
+        .filter(
+            StripeEventLog.processed.is_(False),
+            StripeEventLog.attempts < MAX_ATTEMPTS,
+            or_(StripeEventLog.next_attempt_at.is_(None), StripeEventLog.next_attempt_at <= now),
+        )
+        .order_by(StripeEventLog.id.asc())
+        .with_for_update(skip_locked=True)
+        .limit(1)
+        .first()
+    )
+
+
+def _record_failure(row_id: int, error: Exception) -> None:
+    row = StripeEventLog.query.filter_by(id=row_id).first()
+    if not row:
+        return
+    row.attempts = (row.attempts or 0) + 1
+    row.last_error = str(error)[:1000]
+    row.next_attempt_at = datetime.utcnow() + _backoff(row.attempts)
+    db.session.commit()
+
+
+def _handle_locked(row) -> bool:
+    """Run the handlers for a row we hold FOR UPDATE; True on success."""
+    row_id, etype = row.id, row.type
+    t0 = time.perf_counter()
+    try:
+        with event_unit_of_work(row):
+            handle_event(row.payload)
+        # Per-type cost including the commit: which event types dominate processing time
+        metrics.observe("stripe_events", etype, (time.perf_counter() - t0) * 1000)
+        metrics.incr("stripe_events", f"{etype}:ok")
+        return True
+    except Exception as e:
+        metrics.incr("stripe_events", f"{etype}:failed")
+        log.exception(f"Stripe event {row_id} failed")
+        try:
+            _record_failure(row_id, e)
+        except Exception:
+            db.session.rollback()
+        return False
+
+
+def process_next() -> bool:
+    """
+    Claim and handle one event. Returns True if a row was claimed
+    (whether or not handling succeeded), False if the queue is empty.
+    """
+    row = _claim_next()
+    if row is None:
+        db.session.rollback()  # release the (empty) transaction
+        return False
+    _handle_locked(row)
+    return True
+
+
+def process_event(row_id: int) -> Optional[bool]:
+    """
+    (Re)process one specific log row, processed or not (used by replay).
+    Returns None when another worker currently holds the row.
+    """
+    row = (
+        StripeEventLog.query
+        .filter(StripeEventLog.id == row_id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if row is None:
+        db.session.rollback()
+        return None
+    return _handle_locked(row)
+
+
+def _run(app) -> None:
+    while True:
+        try:
+            with app.app_context():
+                while process_next():
+                    pass
+        except Exception:
+            log.exception("Stripe event worker loop error")
+        _wake.wait(POLL_SECONDS)
+        _wake.clear()
+
+
+def wake_workers() -> None:
+    """Nudge idle workers after a new event was logged."""
+    _wake.set()
+
+
+def start_event_workers(app, count: int = WORKER_COUNT) -> None:
+    """Idempotently spawn the worker pool (no-op when count is 0)."""
+    global _started
+    if count <= 0 or _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        for _ in range(count):
+            socketio.start_background_task(_run, app)
+        _started = True
+        log.info(f"Started {count} Stripe event worker(s)")
@@ -142,6 +142,61 @@ VPS_PLANS = [
     },
 ]
 
+
+class PlanCatalog:
+    """
+    Indexed, read-only view of a plan list: dict lookups by plan_code and by
+    Stripe lookup key, with OS options and prices resolved once.
+    """
+
+    def __init__(self, plans):
+        self.plans = tuple(plans)
+        self.codes = tuple(p["plan_code"] for p in self.plans)
+        self._by_code = {p["plan_code"]: p for p in self.plans}
+        # lookup key -> (plan, "month" | "year")
+        self._by_lookup_key = {}
+        for p in self.plans:
+            self._by_lookup_key[p["stripe_lookup_key_monthly"]] = (p, "month")
+            self._by_lookup_key[p["stripe_lookup_key_yearly"]] = (p, "year")
+        self._os_options = {p["plan_code"]: tuple(p.get("os_options") or DEFAULT_OS_OPTIONS) for p in self.plans}
+        self._prices = {
+            p["plan_code"]: {
+                "month": p.get("monthly_price"),
+                "year": p.get("yearly_price"),
+                "currency": (p.get("currency") or "EUR").upper(),
+            }
+            for p in self.plans
+        }
+
+    def __iter__(self):
+        return iter(self.plans)
+
+    def __len__(self):
+        return len(self.plans)
+
+    def __contains__(self, plan_code):
+        return plan_code in self._by_code
+
+    def get(self, plan_code: str):
+        """Plan dict by plan_code, or None."""
+        return self._by_code.get(plan_code)
+
+    def by_lookup_key(self, lookup_key: str):
+        """(plan dict, "month" | "year") for a Stripe price lookup key, or (None, None)."""
+        return self._by_lookup_key.get(lookup_key, (None, None))
+
+    def os_options(self, plan_code: str):
+        """OS choices ("key:Label") for a plan; the shared list for unknown codes."""
+        return self._os_options.get(plan_code, tuple(DEFAULT_OS_OPTIONS))
+
+    def prices(self, plan_code: str):
+        """{"month", "year", "currency"} for a plan, or None."""
+        return self._prices.get(plan_code)
+
+
+CATALOG = PlanCatalog(VPS_PLANS)
+
+
 def get_plan_by_code(plan_code: str):
     """Return plan dict by plan_code."""
-    return next((p for p in VPS_PLANS if p["plan_code"] == plan_code), None)
+    return CATALOG.get(plan_code)
@@ -1,2 +1,3 @@
 from . import subscriptions  # fq401
 from . import vps
+from . import metrics  # noqa: F401
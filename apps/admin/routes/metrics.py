@@ -0,0 +1,27 @@
+# apps/admin/routes/metrics.py
+from flask import jsonify
+from flask_login import login_required
+
+from apps.admin.admin import admin_blueprint
+from apps.common import metrics
+from apps.VPS.stripe import client as stripe_client
+from decorators import admin_required, admin_2fa_required
+
+
+@admin_blueprint.route("/api/metrics/stripe", methods=["GET"])
+@login_required
+@admin_required
+@admin_2fa_required
+def admin_stripe_metrics():
+    """
+    Stripe stats for this process:
+    - stripe_http: per-endpoint latency histograms, error counters, breaker + retry budget state
+    - stripe_webhook: received count per event type (+ "ignored" for types with no handler)
+    - stripe_events: per-type processing latency and ok/failed counters
+    """
+    return jsonify({
+        "ok": True,
+        "stripe_http": stripe_client.stats(),
+        "stripe_webhook": metrics.snapshot("stripe_webhook"),
+        "stripe_events": metrics.snapshot("stripe_events"),
+    })
@@ -2,17 +2,30 @@ from flask import Blueprint, render_template, redirect, url_for, session, reques
 from flask_login import current_user, login_required
 from extensions import db
 from apps.chat.models import SupportChat, SupportMessage, SenderRole
+from apps.chat.summary import mark_read
+from apps.chat.socket_events import broadcast_read
 
+from apps.common.filters import dt_short
 from decorators import admin_required, admin_2fa_required
 
-from sqlalchemy import case, func
-from datetime import datetime
+from sqlalchemy import case, func, tuple_
+from sqlalchemy.orm import joinedload
+from datetime import datetime, timedelta
 
 from sqlalchemy import or_
 
 chat_blueprint = Blueprint("chat_blueprint", __name__, url_prefix="/chat")
 
 
+INBOX_PER_PAGE = 50
+INBOX_MAX_PER_PAGE = 200
+
+HISTORY_PER_PAGE = 50
+HISTORY_MAX_PER_PAGE = 200
+
+_EPOCH = datetime(1970, 1, 1)
+
+
 # --------------------------
 # USER: Start a new chat
 # --------------------------
@@ -83,43 +96,25 @@ def view_user_chat():
     if chat.user_id != current_user.id:
         abort(403)
 
-    raw_msgs = (SupportMessage.query
-                .filter_by(chat_id=chat.id)
-                .order_by(SupportMessage.timestamp.asc())   # or .created_at.asc()
-                .all())
+    # Newest page only; older pages load on scroll via user_chat_messages
+    msgs, older_cursor = _history_page(chat, None, HISTORY_PER_PAGE, admin_view=False)
 
-    me_email = getattr(current_user, "email", None)
+    if chat.unread_for_user and msgs:
+        _mark_read_and_broadcast(chat.id, SenderRole.user, msgs[-1]['id'])
 
-    def label_for(m):
-        if _is_admin_sender(m):
-            email = m.sender_email or "admin"
-            return f"{email} (admin)"
-        else:
-            # Prefer stored sender_email; fallback to me (viewer); then "user"
-            return m.sender_email or me_email or "user"
-
-    msgs = []
-    for m in raw_msgs:
-        sender_email = m.sender_email
-        is_admin = _is_admin_sender(m)
-        sender_label = label_for(m)
-
-        # “mine” for user page: my email match, else non-admin
-        if sender_email and me_email:
-            is_mine = sender_email.lower() == me_email.lower()
-        else:
-            is_mine = not is_admin
-
-        msgs.append({
-            "id": m.id,
-            "content": m.message,
-            "timestamp": m.timestamp,       # keep as datetime for now
-            "sender_label": sender_label,
-            "sender_is_admin": is_admin,
-            "is_mine": is_mine,
-        })
-
-    return render_template('chat/user_chat_view.html', chat=chat, messages=msgs)
+    return render_template('chat/user_chat_view.html', chat=chat, messages=msgs,
+                           older_cursor=older_cursor,
+                           history_url=url_for('chat_blueprint.user_chat_messages', chat_id=chat.id))
+
+
+@chat_blueprint.route('/messages/<int:chat_id>', methods=['GET'])
+@login_required
+def user_chat_messages(chat_id):
+    """The page of messages just before ?before=<cursor> (user side)."""
+    chat = SupportChat.query.get_or_404(chat_id)
+    if chat.user_id != current_user.id:
+        abort(403)
+    return _history_json(chat, admin_view=False)
 
 
 # /chat/redirect: jump to the user's open chat if present, else to the empty view
@@ -143,88 +138,66 @@ def admin_inbox():
     Inbox: show chats that actually have messages, sorted:
       - Unread (has at least one unread user msg) first
       - Then by latest message timestamp (newest first)
+    One query per page off the chat summary columns (ix_support_chat_inbox),
+    joined to each chat's last message by id, paged by keyset on
+    (has_unread, last_ts, id) via ?after=.
     """
-    from sqlalchemy import func, or_, case, desc, literal_column
-    print("\n[admin_inbox] ---- START ----")
-
-    total_chats = db.session.query(SupportChat).count()
-    total_msgs  = db.session.query(SupportMessage).count()
-    print(f"[admin_inbox] totals: chats={total_chats}, messages={total_msgs}")
-
-    # Subquery: latest timestamp per chat that has >=1 message
-    last_ts_subq = (
-        db.session.query(
-            SupportMessage.chat_id.label('chat_id'),
-            func.max(SupportMessage.timestamp).label('last_ts')
-        )
-        .group_by(SupportMessage.chat_id)
-        .subquery()
-    )
-
-    # Subquery: unread user messages per chat (enum-safe: enum OR legacy 'user')
-    unread_subq = (
-        db.session.query(
-            SupportMessage.chat_id.label('chat_id'),
-            func.count(SupportMessage.id).label('unread_count')
-        )
-        .filter(
-            SupportMessage.is_read == False,
-            or_(SupportMessage.sender == SenderRole.user, SupportMessage.sender == 'user')
-        )
-        .group_by(SupportMessage.chat_id)
-        .subquery()
+    try:
+        per = min(max(int(request.args.get('per', INBOX_PER_PAGE)), 1), INBOX_MAX_PER_PAGE)
+    except ValueError:
+        per = INBOX_PER_PAGE
+    cursor = _decode_inbox_cursor(request.args.get('after'))
+
+    rows, next_cursor = _inbox_page(cursor, per)
+    inbox = [
+        {
+            'chat': chat,
+            'last_message': {'id': chat.last_message_id, 'message': message, 'timestamp': chat.last_message_at},
+            'unread': chat.unread_for_admin > 0,
+        }
+        for chat, message in rows
+    ]
+    return render_template('chat/admin_chat_inbox.html', chats=inbox,
+                           next_cursor=next_cursor, is_first_page=cursor is None)
+
+
+def _inbox_page(cursor, per: int):
+    """One inbox page plus the cursor for the next one (None on the last page)."""
+    has_unread = SupportChat.unread_for_admin > 0
+
+    # Inner join on the last message: only chats with >=1 message
+    q = (
+        db.session.query(SupportChat, SupportMessage.message)
+        .join(SupportMessage, SupportMessage.id == SupportChat.last_message_id)
+        .filter(SupportChat.last_message_id.isnot(None))  # matches the partial ix_support_chat_inbox
+        .options(joinedload(SupportChat.user))
     )
+    if cursor:
+        q = q.filter(tuple_(has_unread, SupportChat.last_message_at, SupportChat.id) < cursor)
 
-    # Base rows: only chats with messages (via join to last_ts_subq)
     rows = (
-        db.session.query(
-            SupportChat,
-            last_ts_subq.c.last_ts,
-            func.coalesce(unread_subq.c.unread_count, 0).label('unread_count')
-        )
-        .join(last_ts_subq, last_ts_subq.c.chat_id == SupportChat.id)
-        .outerjoin(unread_subq, unread_subq.c.chat_id == SupportChat.id)
-        .order_by(
-            # Unread first (1 for has unread, 0 otherwise), then by last_ts desc
-            desc(
-                case(
-                    (func.coalesce(unread_subq.c.unread_count, 0) > 0, 1),
-                    else_=0
-                )
-            ),
-            last_ts_subq.c.last_ts.desc()
-        )
+        q.order_by(has_unread.desc(), SupportChat.last_message_at.desc(), SupportChat.id.desc())
+        .limit(per + 1)
         .all()
     )
+    next_cursor = None
+    if len(rows) > per:
+        chat, _message = rows[per - 1]
+        next_cursor = _encode_inbox_cursor(chat.unread_for_admin > 0, chat.last_message_at, chat.id)
+    return rows[:per], next_cursor
 
-    print(f"[admin_inbox] rows_from_db={len(rows)}")
 
-    inbox = []
-    for idx, (chat, last_ts, unread_count) in enumerate(rows, start=1):
-        # Fetch the actual last message (ok for MVP; can be optimized later)
-        last_msg = (
-            db.session.query(SupportMessage)
-            .filter_by(chat_id=chat.id)
-            .order_by(SupportMessage.timestamp.desc())
-            .first()
-        )
+def _encode_inbox_cursor(has_unread, last_ts, chat_id) -> str:
+    """'<0|1>.<last_ts in µs since epoch>.<chat id>' of the last row on a page."""
+    return f"{int(bool(has_unread))}.{(last_ts - _EPOCH) // timedelta(microseconds=1)}.{chat_id}"
 
-        unread = unread_count > 0
-
-        print(
-            f"[admin_inbox] #{idx} chat_id={chat.id} user_id={chat.user_id} "
-            f"last_ts={last_ts} last_msg_id={getattr(last_msg,'id',None)} unread={unread}"
-        )
-
-        inbox.append({
-            'chat': chat,
-            'last_message': last_msg,
-            'unread': unread
-        })
-
-    print(f"[admin_inbox] inbox_len={len(inbox)} ---- END ----\n")
-    return render_template('chat/admin_chat_inbox.html', chats=inbox)
 
+def _decode_inbox_cursor(raw):
+    try:
+        unread, us, cid = raw.split(".", 2)
+        return unread == "1", _EPOCH + timedelta(microseconds=int(us)), int(cid)
+    except (AttributeError, ValueError):
+        return None
 
 
 def _is_admin_sender(m):
@@ -232,6 +205,103 @@ def _is_admin_sender(m):
     return (m.sender == SenderRole.admin) or (m.sender == "admin")
 
 
+def _mark_read_and_broadcast(chat_id: int, reader: SenderRole, up_to_id: int) -> None:
+    """One read-cursor write for the page just rendered, then notify other tabs."""
+    result = mark_read(chat_id, reader, up_to_id)
+    db.session.commit()
+    if result:
+        broadcast_read(chat_id, reader.value, *result)
+
+
+def _message_view(m, chat, me_email, admin_view: bool) -> dict:
+    is_admin = _is_admin_sender(m)
+    if is_admin:
+        sender_label = f"{m.sender_email or 'admin'} (admin)"
+    elif admin_view:
+        # Prefer stored sender_email; fallback to chat.user.email; then "user"
+        fallback_user_email = chat.user.email if getattr(chat, "user", None) else None
+        sender_label = m.sender_email or fallback_user_email or "user"
+    else:
+        # Prefer stored sender_email; fallback to me (viewer); then "user"
+        sender_label = m.sender_email or me_email or "user"
+
+    # "mine": exact email match when both known, else by side
+    if m.sender_email and me_email:
+        is_mine = m.sender_email.lower() == me_email.lower()
+    else:
+        is_mine = is_admin if admin_view else not is_admin
+
+    return {
+        "id": m.id,
+        "content": m.message,
+        "timestamp": m.timestamp,       # keep as datetime for now
+        "sender_label": sender_label,
+        "sender_is_admin": is_admin,
+        "is_mine": is_mine,
+    }
+
+
+def _history_page(chat, cursor, per: int, admin_view: bool):
+    """
+    Up to `per` messages older than `cursor` (newest page when None), oldest
+    first, plus the cursor for the page before it (None when none are left).
+    Walks ix_support_message_chat_timestamp backwards by (timestamp, id).
+    """
+    q = SupportMessage.query.filter(SupportMessage.chat_id == chat.id)
+    if cursor:
+        q = q.filter(tuple_(SupportMessage.timestamp, SupportMessage.id) < cursor)
+    rows = q.order_by(SupportMessage.timestamp.desc(), SupportMessage.id.desc()).limit(per + 1).all()
+
+    older_cursor = None
+    if len(rows) > per:
+        rows = rows[:per]
+        older_cursor = _encode_msg_cursor(rows[-1])
+
+    me_email = getattr(current_user, "email", None)
+    return [_message_view(m, chat, me_email, admin_view) for m in reversed(rows)], older_cursor
+
+
+def _history_json(chat, admin_view: bool):
+    try:
+        per = min(max(int(request.args.get('per', HISTORY_PER_PAGE)), 1), HISTORY_MAX_PER_PAGE)
+    except ValueError:
+        per = HISTORY_PER_PAGE
+    cursor = _decode_msg_cursor(request.args.get('before'))
+    if cursor is None:
+        return jsonify({'ok': False, 'error': 'before cursor required'}), 400
+
+    msgs, older_cursor = _history_page(chat, cursor, per, admin_view)
+    return jsonify({
+        'ok': True,
+        'messages': [
+            {
+                'id': m['id'],
+                'message': m['content'],
+                'sender': 'admin' if m['sender_is_admin'] else 'user',
+                'sender_label': m['sender_label'],
+                'timestamp': m['timestamp'].isoformat() if m['timestamp'] else None,
+                'timestamp_display': dt_short(m['timestamp']),
+                'is_mine': m['is_mine'],
+            }
+            for m in msgs
+        ],
+        'next_cursor': older_cursor,
+    })
+
+
+def _encode_msg_cursor(m) -> str:
+    """'<timestamp in µs since epoch>.<message id>' of the oldest message on a page."""
+    return f"{(m.timestamp - _EPOCH) // timedelta(microseconds=1)}.{m.id}"
+
+
+def _decode_msg_cursor(raw):
+    try:
+        us, mid = raw.split(".", 1)
+        return _EPOCH + timedelta(microseconds=int(us)), int(mid)
+    except (AttributeError, ValueError):
+        return None
+
+
 # ----------------------------
 # Admin chat view
 # ----------------------------
@@ -241,55 +311,24 @@ def _is_admin_sender(m):
 def admin_view_chat(chat_id):
     chat = SupportChat.query.get_or_404(chat_id)
 
-    raw_msgs = (SupportMessage.query
-                .filter_by(chat_id=chat.id)
-                .order_by(SupportMessage.timestamp.asc())   # or .created_at.asc()
-                .all())
+    # Newest page only; older pages load on scroll via admin_chat_messages
+    msgs, older_cursor = _history_page(chat, None, HISTORY_PER_PAGE, admin_view=True)
 
-    me_email = getattr(current_user, "email", None)
+    if chat.unread_for_admin and msgs:
+        _mark_read_and_broadcast(chat.id, SenderRole.admin, msgs[-1]['id'])
+
+    return render_template('chat/admin_view_chat.html', chat=chat, messages=msgs,
+                           older_cursor=older_cursor,
+                           history_url=url_for('chat_blueprint.admin_chat_messages', chat_id=chat.id))
 
-    def label_for(m):
-        if _is_admin_sender(m):
-            email = m.sender_email or "admin"
-            return f"{email} (admin)"
-        else:
-            # Prefer stored sender_email; fallback to chat.user.email; then "user"
-            fallback_user_email = chat.user.email if getattr(chat, "user", None) else None
-            return m.sender_email or fallback_user_email or "user"
-
-    msgs = []
-    for m in raw_msgs:
-        sender_email = m.sender_email
-        is_admin = _is_admin_sender(m)
-        sender_label = label_for(m)
-
-        # “mine” on admin page: admin messages, or exact email match for safety
-        if sender_email and me_email:
-            is_mine = sender_email.lower() == me_email.lower()
-        else:
-            is_mine = is_admin
-
-        msgs.append({
-            "id": m.id,
-            "content": m.message,
-            "timestamp": m.timestamp,       # keep as datetime for now
-            "sender_label": sender_label,
-            "sender_is_admin": is_admin,
-            "is_mine": is_mine,
-        })
-
-        (
-            SupportMessage.query
-            .filter(
-                SupportMessage.chat_id == chat.id,
-                SupportMessage.is_read == False,
-                or_(SupportMessage.sender == SenderRole.user, SupportMessage.sender == 'user')
-            )
-            .update({SupportMessage.is_read: True}, synchronize_session=False)
-        )
-        db.session.commit()
-
-    return render_template('chat/admin_view_chat.html', chat=chat, messages=msgs)
+
+@chat_blueprint.route('/admin/messages/<int:chat_id>', methods=['GET'])
+@admin_required
+@admin_2fa_required
+def admin_chat_messages(chat_id):
+    """The page of messages just before ?before=<cursor> (admin side)."""
+    chat = SupportChat.query.get_or_404(chat_id)
+    return _history_json(chat, admin_view=True)
 
 """
 # --------------------------
@@ -0,0 +1,22 @@
+# apps/chat/cli.py
+"""
+Flask CLI for support chat maintenance.
+
+    flask chat rebuild-summaries                 # backfill/repair every chat
+    flask chat rebuild-summaries --chat-id 12 --chat-id 40
+"""
+
+import click
+from flask.cli import AppGroup
+
+from apps.chat import summary
+
+chat_cli = AppGroup("chat", help="Support chat maintenance.")
+
+
+@chat_cli.command("rebuild-summaries")
+@click.option("--chat-id", "chat_ids", multiple=True, type=int, help="Only these chats (repeatable).")
+def rebuild_summaries_cmd(chat_ids):
+    """Recompute SupportChat summary columns from the message history."""
+    count = summary.rebuild(chat_ids or None)
+    click.echo(f"Rebuilt summaries for {count} chat(s).")
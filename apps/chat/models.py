@@ -2,7 +2,7 @@ from extensions import db
 from datetime import datetime
 from sqlalchemy import Enum
 import enum
-from typing import Optional, List
+from typing import Optional, List, Iterable, Dict
 
 
 class SenderRole(enum.Enum):
@@ -18,6 +18,26 @@ def _now():
     return datetime.now()
 
 
+def _wait_seconds(last_user_at: Optional[datetime], last_admin_at: Optional[datetime], now: datetime) -> int:
+    # user waiting if latest user message is strictly newer than last admin message
+    if last_user_at and (last_admin_at is None or last_user_at > last_admin_at):
+        return max(0, int((now - last_user_at).total_seconds()))
+    return 0
+
+
+def _metrics_payload(chat_id, unread, last_user_at, last_admin_at, last_message_at, now: datetime) -> dict:
+    wait_s = _wait_seconds(last_user_at, last_admin_at, now)
+    return {
+        "thread_id": chat_id,
+        "unread": unread or 0,
+        "last_user_msg_at": last_user_at.isoformat() if last_user_at else None,
+        "last_admin_msg_at": last_admin_at.isoformat() if last_admin_at else None,
+        "last_message_at": last_message_at.isoformat() if last_message_at else None,
+        "wait_seconds": wait_s,
+        "waiting": wait_s > 0,
+    }
+
+
 class SupportChat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -25,82 +45,87 @@ class SupportChat(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    # ---------- Denormalized summary (maintained by apps.chat.summary) ----------
+    # Written in the same transaction as each message insert / read-marking,
+    # so reads below are plain column lookups instead of scans over messages.
+    last_message_id = db.Column(db.Integer, nullable=True)   # no FK: support_message already points here
+    last_message_at = db.Column(db.DateTime, nullable=True)
+    last_user_msg_at = db.Column(db.DateTime, nullable=True)
+    last_admin_msg_at = db.Column(db.DateTime, nullable=True)
+    unread_for_admin = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    unread_for_user = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Read cursors: each side has read the other side's messages up to this id
+    admin_last_read_message_id = db.Column(db.Integer, nullable=True)
+    user_last_read_message_id = db.Column(db.Integer, nullable=True)
+
     user = db.relationship('User', backref='support_chats')
 
-    # ---------- Lightweight computed metrics (no schema change) ----------
+    # ---------- Metrics (summary columns / SQL; never loads `messages`) ----------
 
     @property
     def messages_sorted(self) -> List["SupportMessage"]:
         """Messages sorted by timestamp ascending (older first)."""
-        # When relationship loading isn't ordered, sort in-memory.
-        # If a relationship.order_by is set elsewhere, this is still safe.
-        return sorted(self.messages or [], key=lambda m: m.timestamp or datetime.min)
+        return (
+            SupportMessage.query
+            .filter_by(chat_id=self.id)
+            .order_by(SupportMessage.timestamp.asc(), SupportMessage.id.asc())
+            .all()
+        )
 
     @property
     def last_message(self) -> Optional["SupportMessage"]:
         """Last message in this chat (None if empty)."""
-        msgs = self.messages_sorted
-        return msgs[-1] if msgs else None
-
-    @property
-    def last_user_msg_at(self) -> Optional[datetime]:
-        """Timestamp of the latest user message."""
-        ts = [m.timestamp for m in self.messages if m.sender == SenderRole.user and m.timestamp]
-        return max(ts) if ts else None
-
-    @property
-    def last_admin_msg_at(self) -> Optional[datetime]:
-        """Timestamp of the latest admin message."""
-        ts = [m.timestamp for m in self.messages if m.sender == SenderRole.admin and m.timestamp]
-        return max(ts) if ts else None
+        if self.last_message_id is None:
+            return None
+        return db.session.get(SupportMessage, self.last_message_id)
 
     @property
     def unread_count_for_admin(self) -> int:
-        """
-        Naive unread for admin:
-        1) Prefer is_read flag if your app updates it for admin views.
-        2) Fallback: count user messages newer than the last admin message.
-        """
-        # Prefer explicit read flags when available.
-        flagged_unread = [m for m in self.messages if m.sender == SenderRole.user and not (m.is_read or False)]
-        if flagged_unread:
-            return len(flagged_unread)
-
-        # Fallback heuristic: user messages after last admin reply
-        la = self.last_admin_msg_at
-        if la is None:
-            return sum(1 for m in self.messages if m.sender == SenderRole.user)
-        return sum(1 for m in self.messages if m.sender == SenderRole.user and (m.timestamp and m.timestamp > la))
+        """User messages the admins have not read yet."""
+        return self.unread_for_admin or 0
 
     def wait_seconds_since_user(self, now: Optional[datetime] = None) -> int:
         """
         If the last event is a user message and admin hasn't answered since,
         return seconds since that user message. Otherwise 0.
         """
-        now = now or _now()
-        lu = self.last_user_msg_at
-        la = self.last_admin_msg_at
-        # user waiting if latest user message is strictly newer than last admin message
-        if lu and (la is None or lu > la):
-            return max(0, int((now - lu).total_seconds()))
-        return 0
+        return _wait_seconds(self.last_user_msg_at, self.last_admin_msg_at, now or _now())
 
     def metrics_dict(self, now: Optional[datetime] = None) -> dict:
         """
         Compact metrics payload for UI/socket updates.
         """
+        return _metrics_payload(self.id, self.unread_for_admin, self.last_user_msg_at,
+                                self.last_admin_msg_at, self.last_message_at, now or _now())
+
+    @classmethod
+    def metrics_for(cls, chat_ids: Iterable[int], now: Optional[datetime] = None) -> Dict[int, dict]:
+        """
+        metrics_dict for many chats in one query: {chat_id: payload}.
+        Unknown ids are omitted.
+        """
+        ids = list(set(chat_ids))
+        if not ids:
+            return {}
         now = now or _now()
-        last_msg = self.last_message
-        wait_s = self.wait_seconds_since_user(now=now)
-        return {
-            "thread_id": self.id,
-            "unread": self.unread_count_for_admin,
-            "last_user_msg_at": self.last_user_msg_at.isoformat() if self.last_user_msg_at else None,
-            "last_admin_msg_at": self.last_admin_msg_at.isoformat() if self.last_admin_msg_at else None,
-            "last_message_at": last_msg.timestamp.isoformat() if last_msg and last_msg.timestamp else None,
-            "wait_seconds": wait_s,
-            "waiting": wait_s > 0,
-        }
+        rows = (
+            db.session.query(cls.id, cls.unread_for_admin, cls.last_user_msg_at,
+                             cls.last_admin_msg_at, cls.last_message_at)
+            .filter(cls.id.in_(ids))
+            .all()
+        )
+        return {row[0]: _metrics_payload(*row, now) for row in rows}
+
+
+# Admin inbox order: unread first, then newest activity (see chat.admin_inbox).
+# Partial: chats without messages (one per "start chat" click) never reach the inbox.
+db.Index(
+    'ix_support_chat_inbox',
+    (SupportChat.unread_for_admin > 0).self_group().desc(),  # parenthesized: expression key
+    SupportChat.last_message_at.desc(),
+    SupportChat.id.desc(),
+    postgresql_where=SupportChat.last_message_id.isnot(None),
+)
 
 
 class SupportMessage(db.Model):
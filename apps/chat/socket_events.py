@@ -4,6 +4,7 @@ from flask_socketio import join_room, emit
 
 from extensions import socketio, db
 from apps.chat.models import SupportChat, SupportMessage
+from apps.chat.summary import record_message
 from apps.admin.models import AdminUser
 
 from datetime import datetime, timezone
@@ -29,6 +30,26 @@ def _iso_now() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+# Every connected admin socket (inbox + chat tabs) joins this room
+ADMIN_ROOM = "support_admins"
+
+
+def broadcast_read(chat_id: int, reader: str, last_read_message_id: int, unread: int) -> None:
+    """
+    Tell every admin tab that a chat was read by an admin: the inbox clears its
+    badge and other tabs open on the same chat reset their "new messages" count.
+    User-side reads have no listener, so they are not broadcast.
+    """
+    if reader != "admin":
+        return
+    socketio.emit("chat_read", {
+        "chat_id": chat_id,
+        "reader": reader,
+        "last_read_message_id": last_read_message_id,
+        "unread": unread,
+    }, room=ADMIN_ROOM)
+
+
 @socketio.on("join_chat")
 def handle_join_chat(data):
     chat_id = (data or {}).get("chat_id")
@@ -106,9 +127,12 @@ def handle_send_message(data):
             is_read=False
         )
         db.session.add(msg)
+        db.session.flush()
+        record_message(msg)  # chat summary, same transaction
         db.session.commit()
         print(f"[send_message] Saved message to DB (id={msg.id}) at {getattr(msg, 'timestamp', None)}")
     except Exception as e:
+        db.session.rollback()
         print(f"[send_message] DB error: {e}")
         emit("error", {"error": "Database error"}, to=request.sid)
         return {"ok": False, "error": "db_error"}
@@ -160,6 +184,8 @@ def handle_typing(data):
 @socketio.on("connect")
 def _on_connect():
     print(f"[socket] connect sid={request.sid}")
+    if current_user.is_authenticated and _is_admin(current_user):
+        join_room(ADMIN_ROOM)
 
 
 @socketio.on("disconnect")
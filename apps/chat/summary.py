@@ -0,0 +1,164 @@
+# apps/chat/summary.py
+"""
+Maintenance of the denormalized SupportChat summary columns
+(last_message_id/_at, last_user_msg_at, last_admin_msg_at, unread_for_admin,
+unread_for_user) and the per-side read cursors
+(admin_last_read_message_id, user_last_read_message_id).
+
+Every write is a single UPDATE on the chat row, issued in the caller's
+transaction next to the message insert / read-marking, so the summary commits
+or rolls back together with the messages it describes. The row lock taken by
+that UPDATE also serializes concurrent senders on the same chat.
+"""
+
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import case, func, update, select, and_, exists
+
+from extensions import db
+from apps.chat.models import SupportChat, SupportMessage, SenderRole
+
+
+def _role(sender) -> SenderRole:
+    # tolerant to legacy rows where sender might be stored as string
+    return sender if isinstance(sender, SenderRole) else SenderRole(sender)
+
+
+def _takes_over(col, ts):
+    """col IS NULL OR col <= ts (a message at the same instant still takes over)."""
+    return col.is_(None) | (col <= ts)
+
+
+def record_message(msg: SupportMessage) -> None:
+    """
+    Fold a just-flushed message into its chat's summary.
+    Call after db.session.flush() (msg.id / msg.timestamp set), before commit.
+    """
+    from_admin = _role(msg.sender) == SenderRole.admin
+    ts = msg.timestamp
+    newer = _takes_over(SupportChat.last_message_at, ts)
+    side_at = SupportChat.last_admin_msg_at if from_admin else SupportChat.last_user_msg_at
+    unread = SupportChat.unread_for_user if from_admin else SupportChat.unread_for_admin
+
+    db.session.execute(
+        update(SupportChat)
+        .where(SupportChat.id == msg.chat_id)
+        .values({
+            SupportChat.last_message_id: case((newer, msg.id), else_=SupportChat.last_message_id),
+            SupportChat.last_message_at: case((newer, ts), else_=SupportChat.last_message_at),
+            side_at: func.greatest(func.coalesce(side_at, ts), ts),
+            unread: unread + 1,
+        })
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _side_columns(reader: SenderRole):
+    """(writer role, reader's unread counter, reader's read cursor)."""
+    if reader == SenderRole.admin:
+        return SenderRole.user, SupportChat.unread_for_admin, SupportChat.admin_last_read_message_id
+    return SenderRole.admin, SupportChat.unread_for_user, SupportChat.user_last_read_message_id
+
+
+def mark_read(chat_id: int, reader: SenderRole, up_to_id: int) -> Optional[Tuple[int, int]]:
+    """
+    Advance `reader`'s read cursor to up_to_id (never backwards) and recount
+    its unread from the cursor: one row write, no per-message updates.
+
+    The chat row is locked before the recount, so a concurrent send is either
+    committed (and counted here) or still waiting on the lock (and adds its
+    +1 afterwards). Returns (cursor, unread) or None if the chat is gone.
+    """
+    writer, counter, cursor = _side_columns(reader)
+    locked = db.session.execute(
+        select(SupportChat.id).where(SupportChat.id == chat_id).with_for_update()
+    ).scalar()
+    if locked is None:
+        return None
+
+    new_cursor = func.greatest(func.coalesce(cursor, 0), up_to_id)
+    unread = (
+        select(func.count(SupportMessage.id))
+        .where(
+            SupportMessage.chat_id == chat_id,
+            SupportMessage.sender == writer,
+            SupportMessage.id > new_cursor,
+        )
+        .scalar_subquery()
+    )
+    row = db.session.execute(
+        update(SupportChat)
+        .where(SupportChat.id == chat_id)
+        .values({cursor: new_cursor, counter: unread})
+        .returning(cursor, counter)
+        .execution_options(synchronize_session=False)
+    ).one()
+    return row[0], row[1]
+
+
+def rebuild(chat_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute summaries from the message history (backfill after adding the
+    columns, or repair). All chats when chat_ids is None. Returns rows updated.
+    """
+    m, c = SupportMessage, SupportChat
+    is_user = m.sender == SenderRole.user
+    is_admin = m.sender == SenderRole.admin
+
+    def unread_after(cursor):
+        # Past the side's read cursor; chats read before cursors existed fall back to is_read
+        return case((cursor.is_(None), m.is_read.is_not(True)), else_=m.id > cursor)
+
+    agg = (
+        select(
+            m.chat_id.label("chat_id"),
+            func.max(m.timestamp).filter(is_user).label("last_user"),
+            func.max(m.timestamp).filter(is_admin).label("last_admin"),
+            func.count(m.id).filter(and_(is_user, unread_after(c.admin_last_read_message_id))).label("unread_admin"),
+            func.count(m.id).filter(and_(is_admin, unread_after(c.user_last_read_message_id))).label("unread_user"),
+        )
+        .join(c, c.id == m.chat_id)
+        .group_by(m.chat_id)
+        .subquery()
+    )
+    last = (
+        select(m.chat_id.label("chat_id"), m.id.label("msg_id"), m.timestamp.label("ts"))
+        .distinct(m.chat_id)
+        .order_by(m.chat_id, m.timestamp.desc(), m.id.desc())
+        .subquery()
+    )
+
+    stmt = (
+        update(SupportChat)
+        .where(SupportChat.id == agg.c.chat_id, last.c.chat_id == agg.c.chat_id)
+        .values({
+            SupportChat.last_message_id: last.c.msg_id,
+            SupportChat.last_message_at: last.c.ts,
+            SupportChat.last_user_msg_at: agg.c.last_user,
+            SupportChat.last_admin_msg_at: agg.c.last_admin,
+            SupportChat.unread_for_admin: agg.c.unread_admin,
+            SupportChat.unread_for_user: agg.c.unread_user,
+        })
+        .execution_options(synchronize_session=False)
+    )
+    if chat_ids is not None:
+        stmt = stmt.where(SupportChat.id.in_(list(chat_ids)))
+    count = db.session.execute(stmt).rowcount
+    db.session.commit()
+    return count
+
+
+def backfill_missing() -> int:
+    """
+    Rebuild chats that have messages but no summary yet (rows written before
+    the summary columns existed). Cheap no-op once everything is filled.
+    """
+    ids = db.session.execute(
+        select(SupportChat.id).where(
+            SupportChat.last_message_id.is_(None),
+            exists().where(SupportMessage.chat_id == SupportChat.id),
+        )
+    ).scalars().all()
+    if not ids:
+        return 0
+    return rebuild(ids)
@@ -0,0 +1,97 @@
+# apps/common/metrics.py
+"""
+Tiny in-process metrics: labelled counters and fixed-bucket latency histograms.
+
+No external exporter; admin JSON endpoints read `snapshot()` directly.
+Values are per process (we run a single gunicorn eventlet worker).
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from collections import defaultdict
+from typing import Dict, Tuple
+
+# Upper bounds in milliseconds; the last bucket catches everything slower
+BUCKETS_MS: Tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        for i, upper in enumerate(BUCKETS_MS):
+            if ms <= upper:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float) -> float:
+        """Bucket upper bound containing quantile q (max_ms for the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                upper = BUCKETS_MS[i]
+                return self.max_ms if math.isinf(upper) else float(upper)
+        return self.max_ms
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.sum_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.quantile(0.50),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max_ms, 2),
+            "buckets": {("+Inf" if math.isinf(b) else str(b)): c for b, c in zip(BUCKETS_MS, self.counts)},
+        }
+
+
+_lock = threading.Lock()
+_histograms: Dict[str, Dict[str, Histogram]] = defaultdict(dict)
+_counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+def observe(name: str, label: str, ms: float) -> None:
+    """Record one latency sample for metric `name` / `label`."""
+    with _lock:
+        h = _histograms[name].get(label)
+        if h is None:
+            h = _histograms[name][label] = Histogram()
+        h.observe(ms)
+
+
+def incr(name: str, label: str, by: int = 1) -> None:
+    with _lock:
+        _counters[name][label] += by
+
+
+def snapshot(name: str) -> dict:
+    """{"counters": {label: n}, "latency": {label: histogram}} for one metric name."""
+    with _lock:
+        return {
+            "counters": dict(_counters.get(name, {})),
+            "latency": {label: h.snapshot() for label, h in sorted(_histograms.get(name, {}).items())},
+        }
+
+
+def reset(name: str = None) -> None:
+    with _lock:
+        if name is None:
+            _histograms.clear()
+            _counters.clear()
+        else:
+            _histograms.pop(name, None)
+            _counters.pop(name, None)
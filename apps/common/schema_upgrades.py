@@ -0,0 +1,93 @@
+# apps/common/schema_upgrades.py
+"""
+Explicit DDL for columns/indexes added to tables that already exist.
+
+`db.create_all()` only creates missing tables; it never ALTERs one. Every
+statement below is idempotent (IF NOT EXISTS), so running the whole list on
+each start is safe: on a fresh database create_all has already built the
+tables with these columns and the statements are no-ops; on a deployed one
+they bring the schema up to the models.
+
+Runs from app.py right after create_all. To apply by hand (e.g. before
+rolling out new workers):
+
+    flask shell
+    >>> from apps.common.schema_upgrades import apply_schema_upgrades
+    >>> apply_schema_upgrades()
+
+Append new entries at the end; never edit one that has shipped.
+"""
+
+import logging
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+from extensions import db
+
+log = logging.getLogger(__name__)
+
+# (description, statements) in the order they must run
+UPGRADES: List[Tuple[str, List[str]]] = [
+    (
+        "stripe_event_logs: worker retry bookkeeping",
+        [
+            "ALTER TABLE stripe_event_logs ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE stripe_event_logs ADD COLUMN IF NOT EXISTS last_error VARCHAR(1000)",
+            "ALTER TABLE stripe_event_logs ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP WITHOUT TIME ZONE",
+            "CREATE INDEX IF NOT EXISTS ix_stripe_event_logs_unprocessed ON stripe_event_logs (id) "
+            "WHERE processed = false",
+        ],
+    ),
+    (
+        "billing_records / vps_subscriptions: out-of-order event guard",
+        [
+            "ALTER TABLE billing_records ADD COLUMN IF NOT EXISTS source_event_at TIMESTAMP WITHOUT TIME ZONE",
+            "ALTER TABLE vps_subscriptions ADD COLUMN IF NOT EXISTS source_event_at TIMESTAMP WITHOUT TIME ZONE",
+        ],
+    ),
+    (
+        "support_chat: denormalized summary + inbox index",
+        [
+            "ALTER TABLE support_chat ADD COLUMN IF NOT EXISTS last_message_id INTEGER",
+            "ALTER TABLE support_chat ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP WITHOUT TIME ZONE",
+            "ALTER TABLE support_chat ADD COLUMN IF NOT EXISTS last_user_msg_at TIMESTAMP WITHOUT TIME ZONE",
+            "ALTER TABLE support_chat ADD COLUMN IF NOT EXISTS last_admin_msg_at TIMESTAMP WITHOUT TIME ZONE",
+            "ALTER TABLE support_chat ADD COLUMN IF NOT EXISTS unread_for_admin INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE support_chat ADD COLUMN IF NOT EXISTS unread_for_user INTEGER NOT NULL DEFAULT 0",
+            "CREATE INDEX IF NOT EXISTS ix_support_chat_inbox ON support_chat "
+            "((unread_for_admin > 0) DESC, last_message_at DESC, id DESC) WHERE last_message_id IS NOT NULL",
+        ],
+    ),
+    (
+        "support_chat: per-side read cursors",
+        [
+            "ALTER TABLE support_chat ADD COLUMN IF NOT EXISTS admin_last_read_message_id INTEGER",
+            "ALTER TABLE support_chat ADD COLUMN IF NOT EXISTS user_last_read_message_id INTEGER",
+        ],
+    ),
+    (
+        "billing_records: order history index",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_billing_records_user_created "
+            "ON billing_records (user_id, created_at DESC, id DESC)",
+            "DROP INDEX IF EXISTS ix_billing_records_user_livemode_created",
+        ],
+    ),
+]
+
+
+def apply_schema_upgrades() -> List[str]:
+    """Run every upgrade in order, one transaction each. Returns descriptions applied."""
+    applied = []
+    for description, statements in UPGRADES:
+        try:
+            for sql in statements:
+                db.session.execute(text(sql))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            log.exception(f"Schema upgrade failed: {description}")
+            raise
+        applied.append(description)
+    return applied
@@ -138,6 +138,13 @@ window.socket = window.socket || io({ path: "/socket.io/", withCredentials: true
       }
     });
 
+    // Another admin tab opened this chat (server broadcast to all admin sockets)
+    socket.off("chat_read");
+    socket.on("chat_read", (data) => {
+      if (Number(data?.chat_id) !== chatId || data.reader !== "admin") return;
+      window.__chatIndicator?.markAllSeen?.();
+    });
+
     // Initial scroll
     scrollToBottom(false);
   });
@@ -4,4 +4,15 @@ document.addEventListener('DOMContentLoaded', function () {
       // Simple, reliable refresh. No dependency on other JS.
       window.location.reload();
     });
-});
\ No newline at end of file
+
+    // Live read state: another admin tab opened a chat -> clear its badge here
+    if (typeof window.io !== 'function') return;
+    window.socket = window.socket || io({ path: "/socket.io/", withCredentials: true });
+    window.socket.on('chat_read', (data) => {
+      if (!data || data.reader !== 'admin') return;
+      const li = document.querySelector(`li[data-chat-id="${Number(data.chat_id)}"]`);
+      if (!li || data.unread > 0) return;
+      li.classList.remove('unread-chat');
+      li.querySelector('.badge')?.remove();
+    });
+});
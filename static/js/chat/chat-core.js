@@ -94,7 +94,8 @@
         for (const m of mutations) {
           for (const n of m.addedNodes) {
             if (!(n instanceof HTMLElement)) continue;
-            if (n.classList?.contains('chat-message')) {
+            // Older pages prepended by the history loader are not "new"
+            if (n.classList?.contains('chat-message') && !n.dataset.history) {
               const isMine = n.classList.contains('me');
               onNewMessage(isMine);
               sawMessage = true;
@@ -110,15 +111,102 @@
     scrollToBottom(false);
     updateIndicator();
 
-    const api = { onNewMessage, scrollToBottom, disconnect: () => observer?.disconnect() };
+    // Another tab read the chat: nothing here is unseen any more
+    const markAllSeen = () => { unseen = 0; updateIndicator(); };
+
+    const api = { onNewMessage, scrollToBottom, markAllSeen, disconnect: () => observer?.disconnect() };
     chatEl.__indicatorBound = true;
     chatEl.__indicatorAPI = api;
     return api;
   }
 
+  // Build a bubble like the server-rendered template (history JSON shape)
+  function buildHistoryNode(m) {
+    const root = document.createElement('div');
+    root.className = `chat-message ${m.is_mine ? 'me' : 'them'}`;
+    root.dataset.history = '1';
+    if (m.id != null) root.dataset.id = m.id;
+
+    const bubble = document.createElement('div');
+    bubble.className = 'msg-bubble';
+    root.appendChild(bubble);
+
+    const header = document.createElement('div');
+    header.className = 'msg-header';
+    bubble.appendChild(header);
+
+    const senderSpan = document.createElement('span');
+    senderSpan.className = 'sender';
+    senderSpan.textContent = m.sender_label || '';
+    header.appendChild(senderSpan);
+
+    const timeSpan = document.createElement('span');
+    timeSpan.className = 'timestamp';
+    timeSpan.textContent = m.timestamp_display || m.timestamp || '';
+    header.appendChild(timeSpan);
+
+    const body = document.createElement('div');
+    body.className = 'msg-body';
+    body.textContent = m.message ?? '';
+    bubble.appendChild(body);
+
+    return root;
+  }
+
+  // Lazy scroll-back: fetch older pages (keyset cursor) when scrolled near the top
+  function initHistoryLoader(chatEl, { url, cursor, topThresholdPx = 80 } = {}) {
+    if (!chatEl || !url) return null;
+    if (chatEl.__historyBound) return chatEl.__historyAPI;
+
+    let next = cursor || null;
+    let loading = false;
+
+    async function loadOlder() {
+      if (!next || loading) return;
+      loading = true;
+      try {
+        const sep = url.includes('?') ? '&' : '?';
+        const res = await fetch(`${url}${sep}before=${encodeURIComponent(next)}`, {
+          credentials: 'same-origin',
+          headers: { Accept: 'application/json' }
+        });
+        const data = await res.json();
+        if (!res.ok || !data.ok) throw new Error(data.error || res.status);
+
+        // Prepend while keeping the visible messages where they are
+        const prevHeight = chatEl.scrollHeight;
+        const frag = document.createDocumentFragment();
+        for (const m of data.messages || []) frag.appendChild(buildHistoryNode(m));
+        chatEl.insertBefore(frag, chatEl.querySelector('.chat-message') || chatEl.firstChild);
+        chatEl.scrollTop += chatEl.scrollHeight - prevHeight;
+
+        next = data.next_cursor || null;
+      } catch (err) {
+        console.warn('[chat-core] history load failed:', err);
+        return;
+      } finally {
+        loading = false;
+      }
+      // Short first page that doesn't overflow yet: keep filling
+      if (next && chatEl.scrollHeight <= chatEl.clientHeight) loadOlder();
+    }
+
+    chatEl.addEventListener('scroll', () => {
+      if (chatEl.scrollTop <= topThresholdPx) loadOlder();
+    }, { passive: true });
+
+    if (next && chatEl.scrollHeight <= chatEl.clientHeight) loadOlder();
+
+    const api = { loadOlder, hasMore: () => !!next };
+    chatEl.__historyBound = true;
+    chatEl.__historyAPI = api;
+    return api;
+  }
+
   // Create namespace once
   window.ChatShared = window.ChatShared || {};
   window.ChatShared.initNewMessageIndicator = window.ChatShared.initNewMessageIndicator || initNewMessageIndicator;
+  window.ChatShared.initHistoryLoader = window.ChatShared.initHistoryLoader || initHistoryLoader;
 
   document.addEventListener('DOMContentLoaded', () => {
     const el = document.getElementById('chat-messages');
@@ -131,5 +219,11 @@
         scrollCooldownMs: 300
       });
     }
+    if (el && el.dataset.historyUrl) {
+      window.__chatHistory = initHistoryLoader(el, {
+        url: el.dataset.historyUrl,
+        cursor: el.dataset.olderCursor
+      });
+    }
   });
 })();
@@ -0,0 +1,75 @@
+// static/js/vps/checkout_pending.js
+// Waits for the webhook worker to push this checkout's outcome over Socket.IO.
+// Falls back to polling /vps/checkout-status only while the socket is down.
+(function () {
+  const root = document.getElementById("checkout-pending");
+  if (!root) return;
+
+  const sessionId = root.dataset.sessionId;
+  const statusUrl = root.dataset.statusUrl;
+  const successUrl = root.dataset.successUrl;
+  const cancelUrl = root.dataset.cancelUrl;
+
+  let done = false;
+  let polling = false;
+  let pollTimer = null;
+
+  function finish(state) {
+    if (done) return;
+    if (state === "paid") {
+      done = true;
+      window.location = successUrl;
+    } else if (state === "failed") {
+      done = true;
+      window.location = cancelUrl;
+    }
+  }
+
+  function checkOnce() {
+    return fetch(statusUrl, { credentials: "same-origin" })
+      .then(r => r.json())
+      .then(j => finish(j.state))
+      .catch(() => {});
+  }
+
+  function startPolling() {
+    if (polling || done) return;
+    polling = true;
+    (function poll() {
+      if (!polling || done) return;
+      checkOnce().finally(() => {
+        if (polling && !done) pollTimer = setTimeout(poll, 2500);
+      });
+    })();
+  }
+
+  function stopPolling() {
+    polling = false;
+    clearTimeout(pollTimer);
+    pollTimer = null;
+  }
+
+  if (typeof io !== "function") {
+    startPolling();
+    return;
+  }
+
+  const socket = window.socket || io({ path: "/socket.io/", withCredentials: true });
+  window.socket = socket;
+
+  socket.on("checkout_state", (msg) => {
+    if (msg && msg.session_id === sessionId) finish(msg.state);
+  });
+
+  socket.on("connect", () => {
+    stopPolling();
+    socket.emit("join_checkout", { session_id: sessionId }, (ack) => {
+      if (!ack || !ack.ok) { startPolling(); return; }
+      // The outcome may have been pushed before we joined: ask once
+      checkOnce();
+    });
+  });
+
+  socket.on("disconnect", startPolling);
+  socket.on("connect_error", startPolling);
+})();